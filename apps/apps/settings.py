@@ -65,8 +65,21 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'market.middleware.QueryCountMiddleware',
+    'market.middleware.ReplicaPinMiddleware',
 ]
 
+# Запросы, сделавшие больше SQL-запросов, пишутся в лог market.queries
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 30))
+
+# Сколько минут товар держится за неподтверждённым заказом
+STOCK_RESERVATION_MINUTES = int(os.getenv('STOCK_RESERVATION_MINUTES', 30))
+
+# Сколько часов хранится ответ на POST с Idempotency-Key
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+# Через сколько секунд запрос без сохранённого ответа считается брошенным и выполняется заново
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT_SECONDS = int(os.getenv('IDEMPOTENCY_IN_FLIGHT_TIMEOUT_SECONDS', 60))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
@@ -99,12 +112,81 @@ WSGI_APPLICATION = 'apps.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql — боевой профиль: несколько воркеров gunicorn пишут параллельно.
+# По умолчанию SQLite для локального запуска и тестов.
+if os.getenv('DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'postgres'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'db'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # проверять соединение перед запросом, а не падать на первом после рестарта БД
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv('DB_POOL_MAX_SIZE'):
+        # пул psycopg на процесс; с ним CONN_MAX_AGE должен быть 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', 60))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL: чтение не блокирует запись; IMMEDIATE берёт блокировку на запись в начале
+                # транзакции, а не при первом UPDATE, поэтому конкурирующие записи ждут timeout,
+                # а не падают с "database is locked"
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+
+# Реплики только для чтения каталога (market/routers.py): POSTGRES_REPLICA_HOSTS=host1,host2
+# или SQLITE_REPLICA_PATH — второй файл SQLite, чтобы проверить маршрутизацию локально
+if os.getenv('DB_ENGINE') == 'postgresql':
+    replica_hosts = [host for host in os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+    replicas = {f'replica{i}': {'HOST': host} for i, host in enumerate(replica_hosts, 1)}
+else:
+    replicas = {'replica': {'NAME': os.getenv('SQLITE_REPLICA_PATH')}} if os.getenv('SQLITE_REPLICA_PATH') else {}
+for alias, overrides in replicas.items():
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        **overrides,
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        # в тестах реплика — та же БД, что и primary
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = list(replicas)
+DATABASE_ROUTERS = ['market.routers.ReplicaRouter']
+# столько секунд после записи пользователь читает каталог с primary
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# С несколькими воркерами нужен общий кэш (Redis), иначе инвалидация видна только одному процессу
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 
 # Password validation
@@ -154,7 +236,9 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'market.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(os.getenv('PAGE_SIZE', 20)),
 }
 
 SIMPLE_JWT = {
@@ -171,4 +255,10 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'attokurovbilal08@gmail.com'          # твой Gmail
-EMAIL_HOST_PASSWORD = 'momh fxqf isyq cxnc'
\ No newline at end of file
+EMAIL_HOST_PASSWORD = 'momh fxqf isyq cxnc'
+# Тайм-аут SMTP, чтобы воркер outbox не висел на недоступном сервере
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', 20))
+
+# Письма уходят через таблицу OutboxEmail и команду send_outbox_emails.
+# После стольких неудачных попыток письмо помечается failed
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
\ No newline at end of file
@@ -24,6 +24,12 @@ admin.site.register(Cart)
 admin.site.register(CartItem)
 admin.site.register(Sale)
 admin.site.register(SellerRequest)
+admin.site.register(StockReservation)
+admin.site.register(IdempotencyKey)
 
 
 
+admin.site.register(StoreDailySales)
+admin.site.register(ProductDailySales)
+admin.site.register(RollupWatermark)
+admin.site.register(OutboxEmail)
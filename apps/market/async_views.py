@@ -0,0 +1,148 @@
+"""
+Асинхронные версии read-heavy эндпоинтов каталога для запуска под ASGI (uvicorn).
+Отдают те же сериализаторы, что и DRF-вьюхи, но данные читают через async ORM,
+а независимые запросы одного ответа (товары и их картинки) выполняют через asyncio.gather.
+Пагинация — те же классы и тот же ?cursor=, что у DRF-вьюх: запрос страницы строит
+page_queryset(), а выполняется он здесь, без потока.
+"""
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import SALES_TIMEOUT, sales_cache_key
+from .filters import ProductFilter, ProductSearchFilter
+from .models import Category, Product, ProductImage, Sale, Store
+from .pagination import IdCursorPagination, ProductCursorPagination
+from .search import search_products
+from .serializers import (
+    CategoryListSerializer, ProductDetailSerializers, ProductImageSerializer, ProductListSerializers, SaleSerializer,
+    StoreListSerializer,
+)
+from .views import ProductListAPIView
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def _not_found(exc):
+    return _json({'detail': str(exc.detail)}, status=404)
+
+
+async def _fetch(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _paginate(request, queryset, paginator_class=IdCursorPagination, view=None, images=False):
+    """
+    Страница в формате ответа DRF-пагинатора: {'next', 'previous', 'results'}.
+    С images=True картинки страницы читаются параллельно со страницей — по тому же подзапросу.
+    """
+    paginator = paginator_class()
+    page_queryset = paginator.page_queryset(queryset, Request(request), view)
+    image_rows = None
+    if not images:
+        rows = await _fetch(page_queryset)
+    elif 'search_rank' in page_queryset.query.annotations:
+        # RawSQL поиска ссылается на "market_product" по имени и не работает внутри подзапроса,
+        # так что при поиске картинки читаем по id уже полученной страницы
+        rows = await _fetch(page_queryset)
+        image_rows = await _fetch(ProductImage.objects.filter(product__in=[row.pk for row in rows]).order_by('id'))
+    else:
+        rows, image_rows = await asyncio.gather(
+            _fetch(page_queryset),
+            _fetch(ProductImage.objects.filter(product__in=page_queryset.values('id')).order_by('id')),
+        )
+    page = paginator.paginate_rows(rows)
+    return paginator, page, image_rows
+
+
+def _serialize_products(serializer_class, products, images, request):
+    # картинки уже прочитаны: подставляем их сами, чтобы сериализатор не ходил за ними в БД по товару
+    by_product = defaultdict(list)
+    for image in images:
+        by_product[image.product_id].append(image)
+    context = {'request': request}
+    serializer = serializer_class(context=context)
+    field_names = list(serializer.fields)
+    del serializer.fields['images']
+    image_serializer = ProductImageSerializer(context=context)
+
+    results = []
+    for product in products:
+        data = serializer.to_representation(product)
+        data['images'] = [image_serializer.to_representation(image) for image in by_product[product.pk]]
+        results.append({name: data[name] for name in field_names})
+    return results
+
+
+async def _list_data(request, queryset, serializer_class):
+    paginator, page, _ = await _paginate(request, queryset)
+    return {
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'results': serializer_class(page, many=True, context={'request': request}).data,
+    }
+
+
+async def product_list(request):
+    filterset = ProductFilter(request.GET, queryset=Product.objects.select_related('store'))
+    # валидация фильтра по подкатегории читает БД, поэтому в потоке
+    if not await sync_to_async(filterset.is_valid)():
+        return _json(filterset.errors, status=400)
+    queryset = search_products(filterset.qs, request.GET.get(ProductSearchFilter.search_param))
+    try:
+        # ordering разбирает тот же OrderingFilter, что и у ProductListAPIView
+        paginator, page, images = await _paginate(
+            request, queryset, ProductCursorPagination, view=ProductListAPIView(), images=True,
+        )
+    except NotFound as exc:
+        return _not_found(exc)
+    return _json({
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+        'results': _serialize_products(ProductListSerializers, page, images, request),
+    })
+
+
+async def product_detail(request, pk):
+    product, images = await asyncio.gather(
+        Product.objects.select_related('store').filter(pk=pk).afirst(),
+        _fetch(ProductImage.objects.filter(product_id=pk).order_by('id')),
+    )
+    if product is None:
+        return _json({'detail': 'Страница не найдена.'}, status=404)
+    return _json(_serialize_products(ProductDetailSerializers, [product], images, request)[0])
+
+
+async def category_list(request):
+    try:
+        return _json(await _list_data(request, Category.objects.all(), CategoryListSerializer))
+    except NotFound as exc:
+        return _not_found(exc)
+
+
+async def store_list(request):
+    try:
+        return _json(await _list_data(request, Store.objects.all(), StoreListSerializer))
+    except NotFound as exc:
+        return _not_found(exc)
+
+
+async def sale_list(request):
+    key = await sync_to_async(sales_cache_key)(request.build_absolute_uri())
+    data = await cache.aget(key)
+    if data is None:
+        try:
+            data = await _list_data(request, Sale.objects.filter(is_live=True).select_related('product'), SaleSerializer)
+        except NotFound as exc:
+            return _not_found(exc)
+        await cache.aset(key, data, SALES_TIMEOUT)
+    return _json(data)
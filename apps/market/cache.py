@@ -0,0 +1,32 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+PRODUCT_FACETS_KEY = 'market:product_facets'
+PRODUCT_FACETS_TIMEOUT = 60 * 15
+
+SALES_VERSION_KEY = 'market:sales_version'
+SALES_TIMEOUT = 60 * 5
+
+CATEGORY_TREE_KEY = 'market:category_tree'
+# дерево меняет только админ, инвалидация идёт сигналами — TTL просто страховка
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+
+def invalidate_product_facets():
+    cache.delete(PRODUCT_FACETS_KEY)
+
+
+def invalidate_category_tree():
+    cache.delete(CATEGORY_TREE_KEY)
+
+
+def sales_cache_key(url):
+    # у списка акций много страниц — сбрасываем их все сменой версии
+    version = cache.get_or_set(SALES_VERSION_KEY, uuid4().hex, None)
+    return f'market:sales:{version}:{url}'
+
+
+def invalidate_sales():
+    cache.set(SALES_VERSION_KEY, uuid4().hex, None)
@@ -0,0 +1,101 @@
+import csv
+import json
+import zlib
+
+from .models import OrderItem, Product
+
+
+EXPORT_CHUNK_SIZE = 2000
+# сколько байт копить перед отдачей клиенту: меньше мелких записей в сокет
+FLUSH_BYTES = 64 * 1024
+
+# (заголовок, поле для values_list)
+DATASETS = {
+    'products': (
+        lambda owner: Product.objects.filter(store__store_owner=owner).order_by('id'),
+        (
+            ('id', 'id'),
+            ('product_name', 'product_name'),
+            ('subcategory', 'product_subcategory__subcategory_name'),
+            ('price', 'price'),
+            ('effective_price', 'effective_price'),
+            ('stock', 'stock'),
+            ('country', 'country'),
+            ('updated_at', 'updated_at'),
+        ),
+    ),
+    'order-items': (
+        lambda owner: OrderItem.objects.filter(product__store__store_owner=owner).order_by('id'),
+        (
+            ('id', 'id'),
+            ('order', 'order_id'),
+            ('created_at', 'order__created_at'),
+            ('status', 'order__status'),
+            ('customer', 'order__customer__username'),
+            ('product', 'product_id'),
+            ('product_name', 'product__product_name'),
+            ('quantity', 'quantity'),
+            ('price', 'price'),
+            ('address', 'address'),
+            ('phone_number', 'phone_number'),
+        ),
+    ),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class _Echo:
+    # csv.writer пишет в "файл", который просто возвращает строку
+    def write(self, value):
+        return value
+
+
+def export_rows(dataset, owner):
+    """Заголовок и ленивый итератор строк: в памяти не больше одной пачки из БД."""
+    queryset, columns = DATASETS[dataset]
+    header = [name for name, _ in columns]
+    rows = queryset(owner).values_list(*[lookup for _, lookup in columns]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return header, rows
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), ensure_ascii=False, default=str) + '\n'
+
+
+def encode_chunks(lines, gzip=False):
+    """Склеивает строки в блоки по FLUSH_BYTES и при необходимости сжимает их на лету."""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if gzip else None
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_stream(dataset, fmt, owner, gzip=False):
+    header, rows = export_rows(dataset, owner)
+    lines = csv_lines(header, rows) if fmt == 'csv' else jsonl_lines(header, rows)
+    return encode_chunks(lines, gzip=gzip)
@@ -1,5 +1,12 @@
-from django_filters import FilterSet
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils import timezone
+from django_filters import DateFilter, FilterSet
+from rest_framework.filters import SearchFilter
 from .models import *
+from .search import search_products
 
 
 
@@ -8,4 +15,84 @@ class ProductFilter(FilterSet):
         model = Product
         fields = {
             'product_subcategory': ['exact'],
-            'price': ['gt', 'lt'],}
\ No newline at end of file
+            'price': ['gt', 'lt'],
+            'effective_price': ['gt', 'lt'],}
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class OrderFilter(FilterSet):
+    # границы дня переводим в datetime: created_at__date обернул бы колонку в CAST и индекс не сработал бы
+    created_from = DateFilter(method='filter_created_from')
+    created_to = DateFilter(method='filter_created_to')
+
+    class Meta:
+        model = Order
+        fields = ['status', 'created_from', 'created_to']
+
+    def filter_created_from(self, queryset, name, value):
+        return queryset.filter(created_at__gte=start_of_day(value))
+
+    def filter_created_to(self, queryset, name, value):
+        return queryset.filter(created_at__lt=start_of_day(value + timedelta(days=1)))
+
+
+class ProductSearchFilter(SearchFilter):
+    # вместо LIKE '%q%' ищет по полнотекстовому индексу (см. search.py)
+
+    def filter_queryset(self, request, queryset, view):
+        return search_products(queryset, request.query_params.get(self.search_param))
+
+
+
+# (от, до) в сомах; последняя корзина без верхней границы
+PRICE_BUCKETS = ((0, 500), (500, 1000), (1000, 5000), (5000, None))
+
+
+def price_bucket_expression():
+    whens = []
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        bounds = {'price__gte': low}
+        if high is not None:
+            bounds['price__lt'] = high
+        whens.append(When(then=Value(index), **bounds))
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def product_facets(queryset):
+    """Все фасеты за один GROUP BY по комбинации (подкатегория, страна, магазин, цена)."""
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket_expression())
+        .values(
+            'product_subcategory', 'product_subcategory__subcategory_name',
+            'country', 'store', 'store__store_name', 'price_bucket',
+        )
+        .annotate(count=Count('id'))
+    )
+
+    subcategories, countries, stores = defaultdict(int), defaultdict(int), defaultdict(int)
+    prices = defaultdict(int)
+    total = 0
+    for row in rows:
+        subcategories[(row['product_subcategory'], row['product_subcategory__subcategory_name'])] += row['count']
+        countries[row['country']] += row['count']
+        stores[(row['store'], row['store__store_name'])] += row['count']
+        prices[row['price_bucket']] += row['count']
+        total += row['count']
+
+    def by_count(counter):
+        return sorted(counter.items(), key=lambda item: -item[1])
+
+    return {
+        'total': total,
+        'subcategories': [{'id': pk, 'name': name, 'count': count} for (pk, name), count in by_count(subcategories)],
+        'countries': [{'country': country, 'count': count} for country, count in by_count(countries)],
+        'stores': [{'id': pk, 'name': name, 'count': count} for (pk, name), count in by_count(stores)],
+        'price': [
+            {'min': low, 'max': high, 'count': prices.get(index, 0)}
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models import F
+
+from market.models import Cart, CartItem, Category, Product, Review, Store, SubCategory, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность параллельной записи (корзина и отзывы) на текущем профиле БД. '
+        'Сравнение: запустить с DB_ENGINE=postgresql и без него'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='параллельных потоков (у каждого своё соединение)')
+        parser.add_argument('--ops', type=int, default=200, help='операций на поток в каждом сценарии')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        users, products = self.seed(tag, options['workers'])
+        self.stdout.write(f'{connection.vendor}, потоков: {options["workers"]}, операций на поток: {options["ops"]}')
+        try:
+            for name, operation in (('cart', self.add_to_cart), ('review', self.create_review)):
+                elapsed, done, failed = self.run(operation, users, products, options['ops'])
+                self.stdout.write(
+                    f'{name:>6}: {done / elapsed:8.1f} оп/с, {done} успешно, {failed} ошибок, {elapsed:.2f} с'
+                )
+        finally:
+            self.cleanup(tag)
+
+    def seed(self, tag, workers):
+        owner = UserProfile.objects.create(username=f'bench_{tag}_owner', email=f'{tag}_owner@bench.local',
+                                           user_role='seller')
+        store = Store.objects.create(store_owner=owner, store_name=f'bench_{tag}')
+        category = Category.objects.create(category_name=f'bench_{tag}')
+        subcategory = SubCategory.objects.create(category=category, subcategory_name=f'bench_{tag}')
+        products = Product.objects.bulk_create([
+            Product(store=store, product_subcategory=subcategory, product_name=f'bench {i}', price=100,
+                    effective_price=100, stock=10 ** 6)
+            for i in range(10)
+        ])
+        users = UserProfile.objects.bulk_create([
+            UserProfile(username=f'bench_{tag}_{i}', email=f'{tag}_{i}@bench.local') for i in range(workers)
+        ])
+        return users, products
+
+    def cleanup(self, tag):
+        UserProfile.objects.filter(username__startswith=f'bench_{tag}').delete()
+        Category.objects.filter(category_name=f'bench_{tag}').delete()
+
+    def run(self, operation, users, products, ops):
+        counters = {'done': 0, 'failed': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(len(users) + 1)
+
+        def worker(user):
+            done = failed = 0
+            start.wait()
+            try:
+                for i in range(ops):
+                    try:
+                        operation(user, products[i % len(products)], i)
+                        done += 1
+                    except OperationalError:
+                        # "database is locked" и подобное — то, что мы и сравниваем
+                        failed += 1
+            finally:
+                connections.close_all()
+            with lock:
+                counters['done'] += done
+                counters['failed'] += failed
+
+        threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        close_old_connections()
+        start.wait()
+        began = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - began, counters['done'], counters['failed']
+
+    @staticmethod
+    def add_to_cart(user, product, i):
+        # как CartItemCreateAPIView: корзина пользователя + инкремент количества
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=user)
+            updated = CartItem.objects.filter(cart=cart, product=product).update(quantity=F('quantity') + 1)
+            if not updated:
+                CartItem.objects.create(cart=cart, product=product, quantity=1)
+
+    @staticmethod
+    def create_review(user, product, i):
+        # отзыв + пересчёт счётчиков рейтинга товара сигналом — две записи в одной транзакции
+        with transaction.atomic():
+            Review.objects.create(user=user, product=product, rating=i % 5 + 1, comment='bench')
@@ -0,0 +1,98 @@
+import re
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import URLPattern, get_resolver
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from market.models import UserProfile
+
+
+# "SCAN market_product" без "USING ... INDEX" в SQLite, "Seq Scan on market_product" в PostgreSQL
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)\b(?! USING| VIRTUAL TABLE)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+def full_scans(plan, vendor):
+    pattern = FULL_SCAN.get(vendor)
+    return sorted(set(pattern.findall(plan))) if pattern else []
+
+
+def list_paths():
+    # list-эндпоинты без параметров в URL: у них основной запрос — выборка страницы
+    for pattern in get_resolver().url_patterns:
+        for path, view_class in _walk(pattern, ''):
+            if hasattr(view_class, 'get_queryset') and hasattr(view_class, 'list'):
+                yield path
+
+
+def _walk(pattern, prefix):
+    if isinstance(pattern, URLPattern):
+        route = prefix + str(pattern.pattern)
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class is not None and '<' not in route:
+            yield '/' + route, view_class
+        return
+    for child in pattern.url_patterns:
+        yield from _walk(child, prefix + str(pattern.pattern))
+
+
+class Command(BaseCommand):
+    help = 'Выполняет EXPLAIN для основного запроса list-эндпоинтов и показывает полные сканы таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='пути с query-параметрами, например "/products/?price__gt=100"; '
+                                 'по умолчанию все list-эндпоинты')
+        parser.add_argument('--user', help='от чьего имени строить запросы (по умолчанию первый admin)')
+        parser.add_argument('--fail', action='store_true', help='код возврата 1, если найдены полные сканы')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        flagged = 0
+        for path in options['paths'] or list_paths():
+            try:
+                queryset = self.main_queryset(path, user)
+            except Exception as exc:
+                self.stdout.write(f'{path}: пропущен ({exc.__class__.__name__}: {exc})')
+                continue
+            plan = queryset.explain()
+            scans = full_scans(plan, connections[queryset.db].vendor)
+            # без WHERE полный проход по таблице ожидаем — это просто первая страница списка
+            if scans and queryset.query.where:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'{path}: FULL SCAN {", ".join(scans)}'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(f'{path}: ok')
+        if flagged and options['fail']:
+            raise CommandError(f'Полные сканы в {flagged} запросах')
+
+    def get_user(self, username):
+        if username:
+            try:
+                return UserProfile.objects.get(username=username)
+            except UserProfile.DoesNotExist:
+                raise CommandError(f'Нет пользователя {username}')
+        return UserProfile.objects.filter(user_role='admin').first() or AnonymousUser()
+
+    def main_queryset(self, path, user):
+        match = get_resolver().resolve(path.split('?')[0])
+        view_class = match.func.view_class
+        view = view_class(**match.func.view_initkwargs)
+        request = Request(APIRequestFactory().get(path))
+        request.user = user
+        view.setup(request, *match.args, **match.kwargs)
+        view.request = request
+        view.format_kwarg = None
+
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = view.paginator
+        if paginator is not None and hasattr(paginator, 'get_ordering'):
+            queryset = queryset.order_by(*paginator.get_ordering(request, queryset, view))
+        page_size = getattr(paginator, 'page_size', None) or 20
+        return queryset[:page_size]
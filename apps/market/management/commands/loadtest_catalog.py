@@ -0,0 +1,58 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+from market.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест каталога: синхронные DRF-вьюхи против async-версий через ASGI-обработчик '
+        'в том же процессе, при заданном числе одновременных запросов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='запросов на каждый эндпоинт')
+        parser.add_argument('--concurrency', type=int, default=100, help='одновременных запросов')
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by('id').first()
+        if product is None:
+            raise CommandError('В каталоге нет товаров')
+        pairs = (
+            ('products', '/products/', '/async/products/'),
+            ('product', f'/products/{product.pk}/', f'/async/products/{product.pk}/'),
+            ('categories', '/categories/', '/async/categories/'),
+            ('stores', '/stores/', '/async/stores/'),
+            ('sales', '/sales/', '/async/sales/'),
+        )
+        self.stdout.write(f'запросов: {options["requests"]}, одновременно: {options["concurrency"]}')
+        self.stdout.write(f'{"":>12} {"":>6} {"rps":>8} {"p50, мс":>8} {"p95, мс":>8} {"ошибок":>7}')
+        for name, sync_url, async_url in pairs:
+            for kind, url in (('sync', sync_url), ('async', async_url)):
+                rps, p50, p95, errors = asyncio.run(self.run(url, options['requests'], options['concurrency']))
+                self.stdout.write(f'{name:>12} {kind:>6} {rps:8.1f} {p50:8.1f} {p95:8.1f} {errors:7}')
+
+    async def run(self, url, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        began = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - began
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return total / elapsed, statistics.median(latencies), p95, errors
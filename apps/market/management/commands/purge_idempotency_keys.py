@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from market.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Удаляет ключи идемпотентности старше IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.expired().delete()
+        self.stdout.write(f'Удалено ключей: {deleted}')
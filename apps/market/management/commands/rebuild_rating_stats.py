@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from market.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает rating_count / rating_sum / good_rating_count у всех товаров по таблице отзывов'
+
+    def handle(self, *args, **options):
+        updated = Product.rebuild_rating_stats()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано товаров: {updated}'))
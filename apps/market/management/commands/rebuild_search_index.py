@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from market.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает FTS5-индекс товаров (SQLite). В PostgreSQL GIN-индекс обновляется сам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from market.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Разово пересчитывает effective_price всех товаров со скидкой, например после ручной правки акций в БД. '
+        'Регулярно цены на границах акций пересчитывает воркер run_sale_scheduler --loop'
+    )
+
+    def handle(self, *args, **options):
+        changed = Product.refresh_effective_prices()
+        self.stdout.write(f'Обновлено цен: {changed}')
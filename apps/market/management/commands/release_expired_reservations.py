@@ -0,0 +1,11 @@
+from market.management.loop import LoopCommand
+from market.models import StockReservation
+
+
+class Command(LoopCommand):
+    help = 'Возвращает на склад просроченные резервы и отменяет их заказы'
+
+    def run_once(self, **options):
+        released = StockReservation.release_expired()
+        if released:
+            self.stdout.write(f'Освобождено резервов: {released}')
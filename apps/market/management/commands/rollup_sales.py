@@ -0,0 +1,21 @@
+from market.analytics import rollup_sales
+from market.management.loop import LoopCommand
+
+
+class Command(LoopCommand):
+    help = 'Досчитывает дневную аналитику продаж магазинов с момента прошлого запуска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='пересчитать всю историю, а не только новые дни')
+        super().add_arguments(parser)
+
+    def handle(self, *args, **options):
+        self.full = options['full']
+        super().handle(*args, **options)
+
+    def run_once(self, **options):
+        days = rollup_sales(full=self.full)
+        self.stdout.write(f'Пересчитано дней: {days}')
+        # --full только на первом проходе, дальше — инкрементально
+        self.full = False
@@ -0,0 +1,16 @@
+from market.cache import invalidate_sales
+from market.management.loop import LoopCommand
+from market.models import Sale
+
+
+class Command(LoopCommand):
+    help = (
+        'Включает и выключает акции на границах start_date / end_date и пересчитывает цены их товаров. '
+        'Единственный воркер акций и цен: отдельный refresh_effective_prices в цикле не нужен'
+    )
+
+    def run_once(self, **options):
+        product_ids = Sale.sync_live_flags()
+        if product_ids:
+            invalidate_sales()
+            self.stdout.write(f'Акции переключены, товаров: {len(product_ids)}')
@@ -0,0 +1,19 @@
+from market.management.loop import LoopCommand
+from market.outbox import send_batch
+
+
+class Command(LoopCommand):
+    help = 'Отправляет письма из outbox пачками через одно SMTP-соединение, с повторами и паузами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='писем за одно SMTP-соединение')
+        super().add_arguments(parser)
+
+    def run_once(self, **options):
+        # разбираем всё, что накопилось, пачка за пачкой
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Отправлено: {sent}, ошибок: {failed}')
+            if sent + failed < options['batch_size']:
+                break
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class LoopCommand(BaseCommand):
+    """
+    Команда-воркер: без --loop делает один проход run_once(), с --loop SECONDS
+    повторяет его каждые SECONDS секунд.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                            help='повторять каждые SECONDS секунд (режим воркера)')
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(**options)
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def run_once(self, **options):
+        raise NotImplementedError
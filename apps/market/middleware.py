@@ -0,0 +1,121 @@
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import RequestState, _request_state, pin_key
+
+
+logger = logging.getLogger('market.queries')
+
+
+class AsyncCapableMiddleware:
+    """
+    Под ASGI синхронный middleware заставляет Django гонять каждый запрос через поток,
+    и async-вьюхи теряют смысл. Наследники реализуют и __call__, и __acall__.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+# счётчик текущего запроса; у каждого запроса (и каждой asyncio-задачи) свой контекст
+_query_stats = ContextVar('query_stats', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats['count'] += 1
+        stats['time'] += time.perf_counter() - start
+
+
+def install_query_counter(connection):
+    # обёртка ставится на соединение один раз (сигнал connection_created) и живёт вместе с ним
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class QueryCountMiddleware(AsyncCapableMiddleware):
+    """Считает SQL-запросы и время БД на каждый запрос и отдаёт их в заголовках."""
+
+    def handle(self, request):
+        stats = {'count': 0, 'time': 0.0}
+        token = _query_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = {'count': 0, 'time': 0.0}
+        # async ORM ходит в БД через sync_to_async, а он переносит контекст в поток вместе со счётчиком
+        token = _query_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        return self.report(request, response, stats)
+
+    @staticmethod
+    def report(request, response, stats):
+        db_time_ms = stats['time'] * 1000
+        response['X-DB-Queries'] = str(stats['count'])
+        response['X-DB-Time'] = f'{db_time_ms:.2f}ms'
+
+        if stats['count'] > settings.QUERY_BUDGET:
+            logger.warning(
+                'Query budget exceeded: %s %s -> %s queries, %.2fms (budget %s)',
+                request.method, request.path, stats['count'], db_time_ms, settings.QUERY_BUDGET,
+            )
+        return response
+
+
+class ReplicaPinMiddleware(AsyncCapableMiddleware):
+    """Отдаёт ReplicaRouter текущий запрос и запоминает, что пользователь только что писал в БД."""
+
+    def handle(self, request):
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        user = getattr(request, 'user', None)
+        if state.wrote and settings.DATABASE_REPLICAS and user is not None and user.is_authenticated:
+            cache.set(pin_key(user.pk), 1, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if state.wrote and settings.DATABASE_REPLICAS:
+            user = await request.auser()
+            if user.is_authenticated:
+                await cache.aset(pin_key(user.pk), 1, settings.REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 16:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_stats(apps, schema_editor):
+    Product = apps.get_model('market', 'Product')
+    Review = apps.get_model('market', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_count=Coalesce(Subquery(reviews.annotate(c=Count('id')).values('c')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), 0),
+        good_rating_count=Coalesce(Subquery(
+            reviews.annotate(g=Count('id', filter=Q(rating__gt=3))).values('g')
+        ), 0),
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_sellerrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='good_rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
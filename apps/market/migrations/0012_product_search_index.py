@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 16:20
+
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE market_product_fts USING fts5("
+    "product_name, description, ingredients, country, "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO market_product_fts (rowid, product_name, description, ingredients, country) "
+    "SELECT id, product_name, description, ingredients, country FROM market_product",
+]
+SQLITE_BACKWARD = ["DROP TABLE IF EXISTS market_product_fts"]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX market_product_search_idx ON market_product USING GIN ("
+    "to_tsvector('simple', coalesce(product_name, '') || ' ' || coalesce(description, '') || ' ' || "
+    "coalesce(ingredients, '') || ' ' || coalesce(country, '')))",
+]
+POSTGRES_BACKWARD = ["DROP INDEX IF EXISTS market_product_search_idx"]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0011_product_price_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
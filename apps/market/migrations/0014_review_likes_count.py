@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 16:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_likes_count(apps, schema_editor):
+    Review = apps.get_model('market', 'Review')
+    CommentLike = apps.get_model('market', 'CommentLike')
+    likes = (
+        CommentLike.objects.filter(review=OuterRef('pk')).order_by().values('review')
+        .annotate(c=Count('id')).values('c')
+    )
+    Review.objects.update(likes_count=Coalesce(Subquery(likes), 0))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0013_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 16:11
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def stock_from_quantity(apps, schema_editor):
+    # раньше остаток писали текстом в quantity ("15", "15 шт") — берём число в начале строки
+    Product = apps.get_model('market', 'Product')
+    products = []
+    for product in Product.objects.exclude(quantity__isnull=True).only('id', 'quantity'):
+        match = re.match(r'\s*(\d+)', product.quantity)
+        if match:
+            product.stock = int(match.group(1))
+            products.append(product)
+    Product.objects.bulk_update(products, ['stock'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0014_review_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='market.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='market.product')),
+            ],
+        ),
+        migrations.RunPython(stock_from_quantity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 16:14
+
+from decimal import Decimal
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_effective_price(apps, schema_editor):
+    Product = apps.get_model('market', 'Product')
+    Sale = apps.get_model('market', 'Sale')
+    Product.objects.update(effective_price=F('price'))
+
+    now = django.utils.timezone.now()
+    best = {}
+    live = Sale.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now)
+    for sale in live.order_by('product_id', '-discount_percent', 'id'):
+        best.setdefault(sale.product_id, sale)
+    products = []
+    for product in Product.objects.filter(pk__in=best):
+        sale = best[product.pk]
+        product.active_sale_id = sale.pk
+        product.effective_price = (
+            product.price * (Decimal(100) - sale.discount_percent) / Decimal(100)
+        ).quantize(Decimal('0.01'))
+        products.append(product)
+    Product.objects.bulk_update(products, ['active_sale', 'effective_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0016_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='active_sale',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='market.sale'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=8),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+    ]
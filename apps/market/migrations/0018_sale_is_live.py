@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-18 16:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_is_live(apps, schema_editor):
+    Sale = apps.get_model('market', 'Sale')
+    now = django.utils.timezone.now()
+    Sale.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now).update(is_live=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0017_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='is_live',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['is_active', 'start_date', 'end_date'], name='sale_active_window_idx'),
+        ),
+        migrations.RunPython(fill_is_live, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+class ConditionalGetMixin:
+    """
+    Отвечает 304 Not Modified на If-None-Match / If-Modified-Since до того,
+    как view пойдёт за объектами и сериализатором. Версию ресурса даёт
+    get_resource_version() — обычно один лёгкий запрос по updated_at.
+    """
+
+    def get_resource_version(self):
+        # (last_modified, ключ версии) или None, если объекта нет.
+        # last_modified = None — только ETag: для списков max(updated_at) не сдвигается при удалении
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        version = self.get_resource_version()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+
+        last_modified, key = version
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+        etag = quote_etag(hashlib.md5(f'{key}:{request.get_full_path()}'.encode()).hexdigest())
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class IdempotencyMixin:
+    """
+    POST с заголовком Idempotency-Key выполняется один раз: ответ сохраняется
+    в IdempotencyKey, а повтор с тем же ключом получает его без запуска view.
+    """
+
+    def post(self, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if not key or not request.user.is_authenticated:
+            return super().post(request, *args, **kwargs)
+
+        IdempotencyKey.expired().filter(user=request.user, key=key).delete()
+        IdempotencyKey.abandoned().filter(user=request.user, key=key).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(user=request.user, key=key, request_path=request.path)
+        except IntegrityError:
+            return self.replay(IdempotencyKey.objects.get(user=request.user, key=key), request)
+
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            # ошибка не сохраняется — клиент может повторить с тем же ключом
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        record.status_code = response.status_code
+        record.response_body = JSONRenderer().render(response.data).decode()
+        record.save(update_fields=['status_code', 'response_body'])
+        return response
+
+    def replay(self, record, request):
+        if record.request_path != request.path:
+            return Response({'detail': 'Этот Idempotency-Key уже использован для другого запроса'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record.status_code is None:
+            return Response({'detail': 'Запрос с этим Idempotency-Key ещё выполняется'},
+                            status=status.HTTP_409_CONFLICT)
+        response = HttpResponse(record.response_body, status=record.status_code, content_type='application/json')
+        response['Idempotent-Replayed'] = 'true'
+        return response
@@ -2,11 +2,20 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from  phonenumber_field.modelfields import PhoneNumberField
 from django.core.exceptions import ValidationError
-from django.db.models import Avg
+from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Case, Count, F, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+GOOD_RATING_THRESHOLD = 3
+
+
 class UserProfile(AbstractUser):
     email = models.EmailField(unique=True)
     phone_number = PhoneNumberField(null=True,blank=True, unique=True)
@@ -18,6 +27,10 @@ class UserProfile(AbstractUser):
     user_role = models.CharField(max_length=16, choices=ROLES_CHOICES, default='client')
     profile_icon =models.ImageField(upload_to='profile_iconka/',null=True,blank=True)
 
+    class Meta(AbstractUser.Meta):
+        # списки клиентов/продавцов: WHERE user_role = ? ORDER BY id DESC
+        indexes = [models.Index(fields=['user_role', 'id'], name='user_role_idx')]
+
     def __str__(self):
         return f'{self.username},{self.user_role}'
 
@@ -27,6 +40,7 @@ class Store(models.Model):
     store_name = models.CharField(max_length=100)
     store_image = models.ImageField(upload_to='store_image',null=True,blank=True)
     store_description = models.TextField(max_length=500,null=True,blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.store_name
@@ -41,6 +55,7 @@ class Store(models.Model):
 class Category(models.Model):
     category_name = models.CharField(max_length=100,unique=True)
     category_image = models.ImageField(upload_to='category_image',)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.category_name
@@ -49,6 +64,7 @@ class SubCategory(models.Model):
     category = models.ForeignKey(Category,on_delete=models.CASCADE,related_name='subcategories')
     subcategory_name = models.CharField(max_length=100,unique=True)
     subcategory_image = models.ImageField(upload_to='subcategory_image/')
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.subcategory_name
@@ -62,23 +78,111 @@ class Product(models.Model):
     product_name = models.CharField(max_length=500,null=True,blank=True)
     country = models.CharField(max_length=100,null=True,blank=True)
     ingredients = models.TextField(null=True,blank=True)
-    price =  models.DecimalField(max_digits=8,decimal_places=2,default=0)
+    price =  models.DecimalField(max_digits=8,decimal_places=2,default=0,db_index=True)
+    # цена с учётом лучшей действующей скидки, пересчитывает refresh_effective_prices
+    effective_price = models.DecimalField(max_digits=8, decimal_places=2, default=0, db_index=True, editable=False)
+    active_sale = models.ForeignKey('Sale', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='+', editable=False)
     best_before_date = models.CharField(max_length=100,null=True,blank=True) #Срок годности
     action = models.CharField(max_length=100,null=True,blank=True)
     quantity =  models.CharField(max_length=100,null=True,blank=True)
+    stock = models.PositiveIntegerField(default=0)  # остаток на складе, списывается атомарно
     description = models.TextField(null=True,blank=True)
+    # Агрегаты по отзывам, обновляются сигналами Review (см. signals.py)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    good_rating_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
     def __str__(self):
         return self.product_name
 
+    # меняются только через UPDATE ... F(), полный save() их не пишет (см. save)
+    F_UPDATED_FIELDS = ('stock', 'rating_count', 'rating_sum', 'good_rating_count')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'stock' in field_names:
+            instance._loaded_stock = instance.stock
+        return instance
+
+    def save(self, *args, **kwargs):
+        # скидку берём из БД, а не из active_sale_id экземпляра: он мог устареть с момента чтения
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'price' in update_fields:
+            sale = None
+            if not self._state.adding:
+                sale = Sale.objects.filter(Sale.live_window(timezone.now()), product_id=self.pk).order_by(
+                    '-discount_percent', 'id',
+                ).only('id', 'discount_percent').first()
+            self.effective_price = sale_price(self.price, sale.discount_percent) if sale else self.price
+            self.active_sale = sale
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'effective_price', 'active_sale'}
+
+        stock_delta = 0
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # иначе save() экземпляра, прочитанного до checkout или нового отзыва, вернёт старые значения;
+            # правку остатка продавцом применяем как разницу к текущему значению в БД
+            skip = set(self.F_UPDATED_FIELDS) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skip
+            ]
+            if hasattr(self, '_loaded_stock'):
+                stock_delta = self.stock - self._loaded_stock
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if stock_delta:
+                # пока форма была открыта, checkout мог забрать больше, чем продавец убирает: не уходим ниже нуля
+                Product.objects.filter(pk=self.pk).update(stock=Greatest(F('stock') + stock_delta, 0))
+        if stock_delta:
+            self.refresh_from_db(fields=['stock'])
+        if 'stock' in self.__dict__:
+            self._loaded_stock = self.stock
+
+    @classmethod
+    def refresh_effective_prices(cls, product_ids=None, now=None):
+        """
+        Пересчитывает effective_price / active_sale. Без product_ids трогает только
+        товары с действующей скидкой и товары, у которых скидка только что закончилась.
+        """
+        now = now or timezone.now()
+        live = Sale.objects.filter(Sale.live_window(now))
+        if product_ids is not None:
+            live = live.filter(product_id__in=product_ids)
+            candidates = set(product_ids)
+        else:
+            candidates = set(live.values_list('product_id', flat=True))
+            candidates |= set(cls.objects.filter(active_sale__isnull=False).values_list('pk', flat=True))
+
+        best = {}
+        for sale in live.order_by('product_id', '-discount_percent', 'id').values('id', 'product_id', 'discount_percent'):
+            best.setdefault(sale['product_id'], sale)
+
+        changed = []
+        for product in cls.objects.filter(pk__in=candidates).only('id', 'price', 'effective_price', 'active_sale'):
+            sale = best.get(product.pk)
+            effective_price = sale_price(product.price, sale['discount_percent']) if sale else product.price
+            active_sale_id = sale['id'] if sale else None
+            if (product.effective_price, product.active_sale_id) != (effective_price, active_sale_id):
+                product.effective_price = effective_price
+                product.active_sale_id = active_sale_id
+                product.updated_at = now
+                changed.append(product)
+        cls.objects.bulk_update(changed, ['effective_price', 'active_sale', 'updated_at'], batch_size=500)
+        return len(changed)
+
     @property
     def avg_rating(self):
-        avg = self.review_product.aggregate(avg=Avg('rating'))['avg']
-        return round(avg, 1) if avg else 0
+        if not self.rating_count:
+            return 0
+        return round(self.rating_sum / self.rating_count, 1)
 
     def get_count_rating(self):
-        count = self.review_product.count()
+        count = self.rating_count
 
         if count > 3:
             return '3+'
@@ -86,13 +190,58 @@ class Product(models.Model):
 
     @property
     def good_rate(self):
-        total = self.review_product.count()
+        total = self.rating_count
         if total == 0:
             return '0%'
-        good = self.review_product.filter(rating__gt=3).count()
-        percent = round((good * 100) / total)
+        percent = round((self.good_rating_count * 100) / total)
         return f'{percent}%'
 
+    @staticmethod
+    def _per_product(quantities):
+        return Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+            default=Value(0),
+            output_field=models.PositiveIntegerField(),
+        )
+
+    @classmethod
+    def take_stock(cls, quantities):
+        """
+        Списывает {product_id: n} одним UPDATE ... WHERE stock >= n.
+        Либо списано всё, либо ничего (возвращает False).
+        """
+        amount = cls._per_product(quantities)
+        with transaction.atomic():
+            updated = cls.objects.filter(pk__in=quantities, stock__gte=amount).update(
+                stock=F('stock') - amount, updated_at=timezone.now(),
+            )
+            if updated != len(quantities):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    @classmethod
+    def return_stock(cls, quantities):
+        amount = cls._per_product(quantities)
+        cls.objects.filter(pk__in=quantities).update(stock=F('stock') + amount, updated_at=timezone.now())
+
+    @classmethod
+    def rebuild_rating_stats(cls):
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        return cls.objects.update(
+            rating_count=Coalesce(Subquery(reviews.annotate(c=Count('id')).values('c')), 0),
+            rating_sum=Coalesce(Subquery(reviews.annotate(s=Sum('rating')).values('s')), 0),
+            good_rating_count=Coalesce(Subquery(
+                reviews.annotate(g=Count('id', filter=Q(rating__gt=GOOD_RATING_THRESHOLD))).values('g')
+            ), 0),
+        )
+
+
+def sale_price(price, discount_percent):
+    if not discount_percent:
+        return price
+    return (price * (Decimal(100) - discount_percent) / Decimal(100)).quantize(Decimal('0.01'))
+
 
 class Sale(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales')
@@ -106,6 +255,40 @@ class Sale(models.Model):
 
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
+    # is_active и окно дат на текущий момент; переключает run_sale_scheduler на границах
+    is_live = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'start_date', 'end_date'], name='sale_active_window_idx'),
+            # публичный список: WHERE is_live ORDER BY id DESC; частичный, т.к. Django пишет
+            # булев фильтр как голое "WHERE is_live", которое обычный индекс не использует
+            models.Index(fields=['id'], condition=Q(is_live=True), name='sale_live_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.is_live = self.is_currently_active
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def live_window(cls, now):
+        return Q(is_active=True, start_date__lte=now, end_date__gte=now)
+
+    @classmethod
+    def sync_live_flags(cls, now=None):
+        """Включает начавшиеся и выключает закончившиеся акции, возвращает id их товаров."""
+        now = now or timezone.now()
+        window = cls.live_window(now)
+        with transaction.atomic():
+            starting = cls.objects.filter(window, is_live=False)
+            ending = cls.objects.filter(is_live=True).exclude(window)
+            product_ids = set(starting.values_list('product_id', flat=True))
+            product_ids |= set(ending.values_list('product_id', flat=True))
+            starting.update(is_live=True)
+            ending.update(is_live=False)
+            if product_ids:
+                Product.refresh_effective_prices(product_ids, now=now)
+        return product_ids
 
     @property
     def discounted_price(self):
@@ -144,10 +327,59 @@ class Order(models.Model):
         ('cancelled', 'Отменён')
     ], default='pending')
 
+    class Meta:
+        # история заказов покупателя: WHERE customer_id = ? ORDER BY created_at DESC
+        indexes = [
+            models.Index(fields=['customer', 'created_at'], name='order_customer_created_idx'),
+            models.Index(fields=['customer', 'status', 'created_at'], name='order_customer_status_idx'),
+        ]
 
     def __str__(self):
         return self.customer.username
 
+class StockReservation(models.Model):
+    # товар, списанный под заказ в ожидании; если заказ не подтвердят до expires_at — вернётся на склад
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} до {self.expires_at}'
+
+    @classmethod
+    def expiry(cls):
+        return timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+    @classmethod
+    def release(cls, reservations):
+        with transaction.atomic():
+            rows = list(reservations.select_for_update().values_list('id', 'product_id', 'quantity'))
+            quantities = defaultdict(int)
+            for _, product_id, quantity in rows:
+                quantities[product_id] += quantity
+            if quantities:
+                Product.return_stock(quantities)
+            cls.objects.filter(id__in=[row[0] for row in rows]).delete()
+        return len(rows)
+
+    @classmethod
+    def release_expired(cls, now=None):
+        now = now or timezone.now()
+        with transaction.atomic():
+            expired = cls.objects.filter(expires_at__lte=now, order__status='pending')
+            order_ids = set(expired.values_list('order_id', flat=True))
+            released = cls.release(expired)
+            # update(), а не save(): сигнал Order второй раз резерв не тронет,
+            # поэтому пересчёт аналитики за дни этих заказов заказываем сами
+            cancelled = Order.objects.filter(pk__in=order_ids, status='pending')
+            earliest = cancelled.aggregate(earliest=Min('created_at'))['earliest']
+            cancelled.update(status='cancelled')
+            if earliest is not None:
+                RollupWatermark.rewind(RollupWatermark.SALES, earliest)
+        return released
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name="items", on_delete=models.SET_NULL, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True,related_name='product_items')
@@ -171,12 +403,35 @@ class Review(models.Model):
     photo4 = models.ImageField(upload_to='photo4',null=True,blank=True)
     parent = models.ForeignKey('self',on_delete=models.CASCADE,null=True,blank=True,related_name='replies')
     created_at = models.DateTimeField(auto_now_add=True)
+    # ведётся сигналами CommentLike через F(), пересчитывать count() не нужно
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # отзывы товара верхнего уровня по дате и ответы на них
+        indexes = [models.Index(fields=['product', 'parent', 'created_at'], name='review_product_thread_idx')]
 
     def is_reply(self):
         return self.parent is not None
-    @property
-    def likes_count(self):
-        return self.likes.count()  # считает все лайки для этого отзыва
+
+    def save(self, *args, **kwargs):
+        # как у Product: save() экземпляра, прочитанного до чужого лайка, не должен возвращать старый likes_count
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skip = {'likes_count'} | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skip
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def apply_rating_delta(product_id, rating, sign):
+        Product.objects.filter(pk=product_id).update(
+            rating_count=F('rating_count') + sign,
+            rating_sum=F('rating_sum') + sign * rating,
+            good_rating_count=F('good_rating_count') + (sign if rating > GOOD_RATING_THRESHOLD else 0),
+            updated_at=timezone.now(),
+        )
+
 
     def __str__(self):
         if self.is_reply():
@@ -231,6 +486,9 @@ class Cart(models.Model):
 
     @property
     def total_price(self):
+        # CartAPIView считает сумму в SQL (аннотация total_amount)
+        if hasattr(self, 'total_amount'):
+            return self.total_amount
         return sum(item.total_price for item in self.items.all())
 
 class CartItem(models.Model):
@@ -240,7 +498,9 @@ class CartItem(models.Model):
 
     @property
     def total_price(self):
-        return self.product.price * self.quantity
+        if hasattr(self, 'line_total'):
+            return self.line_total
+        return self.product.effective_price * self.quantity
 
     def __str__(self):
         return f"{self.quantity} x {self.product.product_name}"
@@ -269,3 +529,113 @@ class SellerRequest(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.status}'
+
+
+class IdempotencyKey(models.Model):
+    # ответ на первый POST с заголовком Idempotency-Key; повторы получают его без выполнения view
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # None — запрос ещё выполняется
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f'{self.user_id} {self.key} {self.status_code}'
+
+    @classmethod
+    def expired(cls):
+        return cls.objects.filter(created_at__lt=timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS))
+
+    @classmethod
+    def abandoned(cls):
+        # ответа нет дольше таймаута — воркер упал посреди запроса, ключ можно занять заново
+        return cls.objects.filter(
+            status_code__isnull=True,
+            created_at__lt=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_IN_FLIGHT_TIMEOUT_SECONDS),
+        )
+
+
+class StoreDailySales(models.Model):
+    # дневные итоги магазина; заполняет команда rollup_sales (см. analytics.py)
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('store', 'day')
+
+    def __str__(self):
+        return f'{self.store_id} {self.day}: {self.revenue}'
+
+
+class ProductDailySales(models.Model):
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='product_daily_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'day')
+        indexes = [models.Index(fields=['store', 'day'], name='product_sales_store_day_idx')]
+
+    def __str__(self):
+        return f'{self.product_id} {self.day}: {self.revenue}'
+
+
+class RollupWatermark(models.Model):
+    # момент, до которого агрегаты уже посчитаны
+    SALES = 'sales'
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+    @classmethod
+    def rewind(cls, name, moment):
+        # заставляет следующий прогон пересчитать дни начиная с moment
+        cls.objects.filter(name=name, value__gt=moment).update(value=moment)
+
+
+class OutboxEmail(models.Model):
+    # письмо ставится в очередь в той же транзакции, что и запрос; отправляет send_outbox_emails
+    PENDING, SENT, FAILED = 'pending', 'sent', 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.TextField()  # адреса через запятую
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # выборка воркера: WHERE status = 'pending' AND next_attempt_at <= now
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx')]
+
+    def __str__(self):
+        return f'{self.to}: {self.subject} ({self.status})'
+
+    @classmethod
+    def enqueue(cls, subject, body, from_email, recipient_list):
+        return cls.objects.create(subject=subject, body=body, from_email=from_email, to=','.join(recipient_list))
+
+    @property
+    def recipients(self):
+        return [address for address in self.to.split(',') if address]
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+# пока пачка отправляется, её письма не выдаются другому воркеру
+LEASE = timedelta(minutes=5)
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=2)
+
+
+def backoff(attempts):
+    # 30 с, 1 мин, 2 мин, ... но не больше BACKOFF_MAX
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_batch(batch_size, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = OutboxEmail.objects.filter(
+            status=OutboxEmail.PENDING, next_attempt_at__lte=now,
+        ).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:batch_size])
+        OutboxEmail.objects.filter(pk__in=ids).update(next_attempt_at=now + LEASE)
+    return list(OutboxEmail.objects.filter(pk__in=ids).order_by('id'))
+
+
+def _failed(email, exc, now):
+    email.attempts += 1
+    email.last_error = f'{exc.__class__.__name__}: {exc}'
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+    else:
+        email.next_attempt_at = now + backoff(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_batch(batch_size=50):
+    """
+    Отправляет одну пачку писем из outbox через одно SMTP-соединение.
+    Возвращает (отправлено, ошибок); неудачные письма ждут следующей попытки с экспоненциальной паузой.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    backend = get_connection(fail_silently=False)
+    try:
+        backend.open()
+    except Exception as exc:
+        # сервер недоступен — вся пачка уходит на повтор
+        now = timezone.now()
+        for email in emails:
+            _failed(email, exc, now)
+        return 0, len(emails)
+
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.recipients, connection=backend)
+            try:
+                backend.send_messages([message])
+            except Exception as exc:
+                _failed(email, exc, timezone.now())
+                failed += 1
+                # после обрыва соединение переоткрываем, иначе упадут и остальные письма пачки
+                backend.close()
+                try:
+                    backend.open()
+                except Exception:
+                    # остальные письма пачки вернутся в очередь, когда истечёт LEASE
+                    break
+            else:
+                email.status = OutboxEmail.SENT
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                email.save(update_fields=['status', 'attempts', 'sent_at', 'last_error'])
+                sent += 1
+    finally:
+        backend.close()
+    return sent, failed
@@ -0,0 +1,140 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Курсор хранит значения всех полей сортировки, а не только первого,
+    поэтому страница всегда выбирается условием WHERE (a, id) > (x, y)
+    без OFFSET, даже если у первого поля есть дубликаты.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.paginate_rows(list(queryset))
+
+    def page_queryset(self, queryset, request, view=None):
+        """Запрос страницы (+1 строка, чтобы узнать, есть ли следующая) без выполнения — async-вьюхи выполняют его сами."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            _, reverse, current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*[self._flip(field) for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            try:
+                values = json.loads(current_position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self._after(values, reverse))
+        self.reverse, self.current_position = reverse, current_position
+        return queryset[:self.page_size + 1]
+
+    def paginate_rows(self, results):
+        """Раскладывает строки, полученные по page_queryset(), на страницу и ссылки next/previous."""
+        reverse, current_position = self.reverse, self.current_position
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            following_position = None
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self._cursor(reverse=False, position=self._page_edge(-1, self.next_position)))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self._cursor(reverse=True, position=self._page_edge(0, self.previous_position)))
+
+    def _page_edge(self, index, fallback):
+        if self.page:
+            return self._get_position_from_instance(self.page[index], self.ordering)
+        return fallback
+
+    def _cursor(self, reverse, position):
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            attr = instance[field.lstrip('-')] if isinstance(instance, dict) else getattr(instance, field.lstrip('-'))
+            values.append(str(attr))
+        return json.dumps(values)
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def _after(self, values, reverse):
+        # (a > x) OR (a = x AND b > y) OR ...
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+
+class IdCursorPagination(KeysetCursorPagination):
+    ordering = '-id'
+
+
+class ProductCursorPagination(IdCursorPagination):
+
+    def get_ordering(self, request, queryset, view):
+        # при поиске без явного ?ordering= сортируем по релевантности
+        if 'search_rank' in queryset.query.annotations and not request.query_params.get('ordering'):
+            return ('search_rank', '-id')
+        ordering = list(super().get_ordering(request, queryset, view))
+        # добавляем id, чтобы товары с одинаковой ценой шли в стабильном порядке
+        if ordering[0].lstrip('-') != 'id':
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return tuple(ordering)
+
+
+class OrderCursorPagination(KeysetCursorPagination):
+    # совпадает с индексом (customer, created_at)
+    ordering = ('-created_at', '-id')
@@ -44,3 +44,10 @@ class IsAdminRole(BasePermission):
             request.user.is_authenticated
             and request.user.user_role == 'admin'
         )
+
+
+class IsStoreOwnerOrAdmin(BasePermission):
+    message = "Аналитика доступна только владельцу магазина"
+
+    def has_object_permission(self, request, view, obj):
+        return obj.store_owner_id == request.user.id or request.user.user_role == 'admin'
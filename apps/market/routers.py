@@ -0,0 +1,67 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# модели каталога: их читают на порядок чаще, чем пишут
+CATALOG_MODELS = {'product', 'productimage', 'category', 'subcategory', 'store', 'sale', 'review', 'commentlike'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# состояние текущего HTTP-запроса; вне запроса (команды, воркеры) всё читается с primary
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+class RequestState:
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        # None — ещё не знаем: пользователь определяется только после аутентификации DRF
+        self.pinned = None if request.method in SAFE_METHODS else True
+
+    def use_primary(self):
+        if self.pinned is None:
+            user = getattr(self.request, 'user', None)
+            if user is None or not user.is_authenticated:
+                return False
+            self.pinned = bool(cache.get(pin_key(user.pk)))
+        return self.pinned
+
+
+class ReplicaRouter:
+    """
+    Чтение каталога в GET-запросах уходит на одну из DATABASE_REPLICAS, всё остальное — на primary.
+    Пользователь, который недавно что-то записал, REPLICA_STICKY_SECONDS читает с primary,
+    чтобы не увидеть данные до своей же записи из-за отставания реплики.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        state = _request_state.get()
+        if (
+            not replicas
+            or state is None
+            or model._meta.model_name not in CATALOG_MODELS
+            # внутри транзакции (checkout, select_for_update) читаем то, что пишем
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            or state.use_primary()
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии primary, связи между объектами из разных алиасов допустимы
+        return True
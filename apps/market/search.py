@@ -0,0 +1,85 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'market_product_fts'
+SEARCH_FIELDS = ('product_name', 'description', 'ingredients', 'country')
+MAX_TERMS = 10
+
+# То же выражение, что и в GIN-индексе миграции 0012 — иначе PostgreSQL не возьмёт индекс
+PG_VECTOR = (
+    "to_tsvector('simple', coalesce(\"market_product\".\"product_name\", '') || ' ' || "
+    "coalesce(\"market_product\".\"description\", '') || ' ' || "
+    "coalesce(\"market_product\".\"ingredients\", '') || ' ' || "
+    "coalesce(\"market_product\".\"country\", ''))"
+)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def search_products(queryset, query):
+    """
+    Фильтрует товары по полнотекстовому индексу и добавляет search_rank
+    (чем меньше, тем релевантнее). SQLite — FTS5, PostgreSQL — tsvector + GIN.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+
+    if connections[queryset.db].vendor == 'postgresql':
+        ts_query = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            RawSQL(f"{PG_VECTOR} @@ to_tsquery('simple', %s)", [ts_query], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f"-ts_rank({PG_VECTOR}, to_tsquery('simple', %s))", [ts_query], output_field=FloatField())
+        )
+
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "market_product"."id"',
+            [match],
+            output_field=FloatField(),
+        )
+    )
+
+
+def _uses_fts(using):
+    return connections[using].vendor == 'sqlite'
+
+
+def index_product(product, using='default'):
+    if not _uses_fts(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(SEARCH_FIELDS)}) VALUES (%s, %s, %s, %s, %s)',
+            [product.pk] + [getattr(product, field) for field in SEARCH_FIELDS],
+        )
+
+
+def unindex_product(pk, using='default'):
+    if not _uses_fts(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index(using='default'):
+    if not _uses_fts(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(SEARCH_FIELDS)}) '
+            f'SELECT id, {", ".join(SEARCH_FIELDS)} FROM market_product'
+        )
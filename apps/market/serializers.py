@@ -1,3 +1,6 @@
+from collections import defaultdict
+from datetime import timedelta
+
 from rest_framework import serializers
 from .models import *
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -5,7 +8,9 @@ from rest_framework import status, viewsets, generics, permissions, response
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, prefetch_related_objects
+from django.utils import timezone
 from django_rest_passwordreset.models import ResetPasswordToken
 
 
@@ -175,6 +180,37 @@ class StoreDetailSerializer(serializers.ModelSerializer):
         fields = ('id','store_name','store_image','store_description')
 
 
+class StoreDailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StoreDailySales
+        fields = ('day', 'revenue', 'units', 'orders_count')
+
+
+class TopProductSalesSerializer(serializers.Serializer):
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField(source='product__product_name')
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units = serializers.IntegerField()
+
+
+class StoreAnalyticsSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    units = serializers.IntegerField(read_only=True)
+    orders_count = serializers.IntegerField(read_only=True)
+    days = StoreDailySalesSerializer(many=True, read_only=True)
+    top_products = TopProductSalesSerializer(many=True, read_only=True)
+
+    def validate(self, attrs):
+        # по умолчанию — последние 30 дней
+        attrs.setdefault('date_to', timezone.localdate())
+        attrs.setdefault('date_from', attrs['date_to'] - timedelta(days=29))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError('date_from позже date_to')
+        return attrs
+
+
 class SubCategorySimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = SubCategory
@@ -191,6 +227,24 @@ class CategoryDetailSerializer(serializers.ModelSerializer):
         model = Category
         fields = ('id','category_name','category_image','subcategories',)
 
+class SubCategoryTreeSerializer(serializers.ModelSerializer):
+    product_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SubCategory
+        fields = ('id','subcategory_name','subcategory_image','product_count')
+
+class CategoryTreeSerializer(serializers.ModelSerializer):
+    subcategories = SubCategoryTreeSerializer(many=True, read_only=True)
+    product_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Category
+        fields = ('id','category_name','category_image','product_count','subcategories')
+
+    def get_product_count(self, obj):
+        return sum(sub.product_count for sub in obj.subcategories.all())
+
 class CategorySimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -252,7 +306,7 @@ class ProductCreateSerializers(serializers.ModelSerializer):
         model = Product
         fields = ('id','product_subcategory', 'product_name', 'images',
                   'price','country','ingredients',
-                  'best_before_date','action','quantity','description')
+                  'best_before_date','action','quantity','stock','description')
 
 
 
@@ -274,7 +328,7 @@ class ProductListSerializers(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ('id','store','product_name','images','price','avg_rating','rating_count','good_rate',
+        fields = ('id','store','product_name','images','price','effective_price','avg_rating','rating_count','good_rate',
 )
     def get_rating_count(self, obj):
         return obj.get_count_rating()
@@ -295,8 +349,8 @@ class ProductDetailSerializers(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('id', 'store', 'product_name', 'images',
-                  'price','country','ingredients',
-                  'best_before_date','action','quantity','description','avg_rating','good_rate',
+                  'price','effective_price','country','ingredients',
+                  'best_before_date','action','quantity','stock','description','avg_rating','good_rate',
 )
 
     def get_avg_rating(self, obj):
@@ -334,7 +388,7 @@ class SaleSerializer(serializers.ModelSerializer):
 
 
 class OrderItemSerializers(serializers.ModelSerializer):
-    product_items = ProductMiniSerializers(read_only=True)
+    product_items = ProductMiniSerializers(source='product', read_only=True)
 
     class Meta:
         model = OrderItem
@@ -431,7 +485,7 @@ class ReviewDetailSerializers(serializers.ModelSerializer):
 class CommentLikeSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
     review_text = serializers.CharField(source='review.comment', read_only=True)
-    total_likes = serializers.IntegerField(source='review.likes_count', read_only=True)  # вот здесь
+    total_likes = serializers.IntegerField(source='review.likes_count', read_only=True)  # хранится в Review
 
     class Meta:
         model = CommentLike
@@ -439,9 +493,42 @@ class CommentLikeSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'user_name', 'review_text', 'total_likes')
 
 
+class CommentLikeToggleSerializer(serializers.Serializer):
+    reviews = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100)
+
+    def validate_reviews(self, value):
+        ids = list(dict.fromkeys(value))
+        found = set(Review.objects.filter(id__in=ids).values_list('id', flat=True))
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(f'Отзывы не найдены: {missing}')
+        return ids
+
+    def save(self):
+        user = self.context['request'].user
+        ids = self.validated_data['reviews']
+
+        with transaction.atomic():
+            liked = set(CommentLike.objects.filter(user=user, review_id__in=ids).values_list('review_id', flat=True))
+            # снятие лайка уменьшает счётчик через post_delete
+            CommentLike.objects.filter(user=user, review_id__in=liked).delete()
+
+            to_like = [pk for pk in ids if pk not in liked]
+            try:
+                CommentLike.objects.bulk_create([CommentLike(user=user, review_id=pk) for pk in to_like])
+            except IntegrityError:
+                raise serializers.ValidationError('Лайки изменились параллельным запросом, повторите попытку')
+            # bulk_create не шлёт post_save — увеличиваем счётчики одним UPDATE
+            Review.objects.filter(id__in=to_like).update(likes_count=F('likes_count') + 1)
+
+        counts = dict(Review.objects.filter(id__in=ids).values_list('id', 'likes_count'))
+        return [{'review': pk, 'liked': pk not in liked, 'likes_count': counts[pk]} for pk in ids]
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.product_name')
-    product_price = serializers.ReadOnlyField(source='product.price')
+    # цена со скидкой — по ней checkout и создаст строку заказа
+    product_price = serializers.ReadOnlyField(source='product.effective_price')
     total_price = serializers.ReadOnlyField()
 
     class Meta:
@@ -461,6 +548,112 @@ class CartSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('user',)
 
+class CartOperationSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)  # 0 — удалить позицию
+
+
+class CartBatchSerializer(serializers.Serializer):
+    items = CartOperationSerializer(many=True, allow_empty=False, max_length=200)
+
+    def validate_items(self, value):
+        # одна операция на товар, последняя побеждает; товары проверяем одним запросом
+        quantities = {item['product']: item['quantity'] for item in value}
+        found = set(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+        missing = [pk for pk in quantities if pk not in found]
+        if missing:
+            raise serializers.ValidationError(f'Товары не найдены: {missing}')
+        return quantities
+
+    def save(self):
+        user = self.context['request'].user
+        quantities = self.validated_data['items']
+
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=user)
+            existing = {}
+            to_delete = []
+            for item in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=quantities).order_by('id'):
+                if item.product_id in existing or quantities[item.product_id] == 0:
+                    to_delete.append(item.pk)
+                else:
+                    existing[item.product_id] = item
+
+            to_update = []
+            to_create = []
+            for product_id, quantity in quantities.items():
+                if not quantity:
+                    continue
+                item = existing.get(product_id)
+                if item is None:
+                    to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+                elif item.quantity != quantity:
+                    item.quantity = quantity
+                    to_update.append(item)
+
+            if to_delete:
+                CartItem.objects.filter(pk__in=to_delete).delete()
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+            CartItem.objects.bulk_create(to_create)
+        return cart
+
+
+class CheckoutSerializer(serializers.Serializer):
+    address = serializers.CharField(max_length=500)
+    phone_number = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+
+        with transaction.atomic():
+            # блокировка корзины: повторный/параллельный checkout ждёт и видит уже пустую корзину
+            cart = Cart.objects.select_for_update().filter(user=user).first()
+            quantities = defaultdict(int)
+            if cart:
+                for product_id, quantity in CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'):
+                    quantities[product_id] += quantity
+            if not quantities:
+                raise serializers.ValidationError('Корзина пуста')
+
+            products = (
+                Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk')
+                .values_list('pk', 'effective_price', 'stock', 'product_name')
+            )
+            prices = {}
+            short = []
+            for pk, price, stock, name in products:
+                prices[pk] = price
+                if stock < quantities[pk]:
+                    short.append(name)
+            # take_stock сам проверяет stock >= n, это на случай БД без SELECT ... FOR UPDATE
+            if short or not Product.take_stock(quantities):
+                raise serializers.ValidationError(f'Недостаточно на складе: {", ".join(filter(None, short))}')
+
+            order = Order.objects.create(customer=user)
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product_id=product_id,
+                    quantity=quantity,
+                    price=prices[product_id],
+                    address=validated_data['address'],
+                    phone_number=validated_data.get('phone_number'),
+                )
+                for product_id, quantity in quantities.items()
+            ])
+            expires_at = StockReservation.expiry()
+            StockReservation.objects.bulk_create([
+                StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items()
+            ])
+            CartItem.objects.filter(cart=cart).delete()
+        return order
+
+    def to_representation(self, instance):
+        prefetch_related_objects([instance], 'items__product')
+        return OrderSerializers(instance).data
+
+
 class FavoriteProductSerializer(serializers.ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.product_name')
     product_price = serializers.ReadOnlyField(source='product.price')
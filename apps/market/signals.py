@@ -1,18 +1,151 @@
 from django.dispatch import receiver
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
 from django_rest_passwordreset.signals import reset_password_token_created
-from django.core.mail import send_mail
+from django.db.models import F
+from django.utils import timezone
 import random
 
+from .analytics import SALES_ROLLUP
+from .cache import invalidate_category_tree, invalidate_product_facets, invalidate_sales
+from .middleware import install_query_counter
+from .models import (
+    Category, CommentLike, Order, OutboxEmail, Product, ProductImage, Review, RollupWatermark, Sale,
+    StockReservation, Store, SubCategory,
+)
+from .search import SEARCH_FIELDS, index_product, unindex_product
+
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, *args, **kwargs):
     code = random.randint(1000, 9999)
     reset_password_token.key = str(code)
     reset_password_token.save()
 
-    send_mail(
+    # SMTP не трогаем в запросе: письмо уйдёт через send_outbox_emails
+    OutboxEmail.enqueue(
         "Сброс пароля",
         f"Ваш код для сброса пароля: {code}",
         "noreply@example.com",
         [reset_password_token.user.email],
-        fail_silently=False,
     )
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._old_rating = None
+    if instance.pk:
+        instance._old_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_stats_on_save(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_rating', None)
+    if old == (instance.product_id, instance.rating):
+        return
+    if old:
+        Review.apply_rating_delta(old[0], old[1], -1)
+    Review.apply_rating_delta(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_stats_on_delete(sender, instance, **kwargs):
+    Review.apply_rating_delta(instance.product_id, instance.rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields=None, using='default', **kwargs):
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    index_product(instance, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, using='default', **kwargs):
+    unindex_product(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def reset_product_facets(sender, **kwargs):
+    invalidate_product_facets()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reset_category_tree(sender, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product_on_image_change(sender, instance, **kwargs):
+    # картинки входят в ответ products/<pk>/, значит меняют его ETag
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=CommentLike)
+def increment_likes_count(sender, instance, created, **kwargs):
+    if created:
+        Review.objects.filter(pk=instance.review_id).update(likes_count=F('likes_count') + 1)
+
+
+@receiver(post_delete, sender=CommentLike)
+def decrement_likes_count(sender, instance, **kwargs):
+    Review.objects.filter(pk=instance.review_id).update(likes_count=F('likes_count') - 1)
+
+
+@receiver(post_save, sender=Order)
+def settle_stock_reservations(sender, instance, created, **kwargs):
+    if created or instance.status == 'pending':
+        return
+    if instance.status == 'cancelled':
+        StockReservation.release(instance.reservations.all())
+    else:
+        # отправлен / доставлен — товар ушёл, резерв больше не нужен
+        instance.reservations.all().delete()
+
+
+@receiver(post_save, sender=Order)
+def rewind_sales_rollup(sender, instance, created, **kwargs):
+    # отмена меняет итоги уже посчитанного дня — rollup_sales пересчитает его
+    if not created and instance.status == 'cancelled':
+        RollupWatermark.rewind(SALES_ROLLUP, instance.created_at)
+
+
+@receiver(pre_save, sender=Sale)
+def remember_sale_product(sender, instance, **kwargs):
+    instance._old_product_id = None
+    if instance.pk:
+        instance._old_product_id = Sale.objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def refresh_price_on_sale_change(sender, instance, **kwargs):
+    # акцию могли перенести на другой товар — старый тоже пересчитываем, иначе он останется со скидкой
+    product_ids = {instance.product_id, getattr(instance, '_old_product_id', None)} - {None}
+    Product.refresh_effective_prices(product_ids)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Product)
+def reset_sales_cache(sender, **kwargs):
+    # в ответе акций есть имя и цена товара
+    invalidate_sales()
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    # QueryCountMiddleware считает SQL через обёртку, которая висит на каждом соединении
+    install_query_counter(connection)
@@ -1,3 +1,1207 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from io import StringIO
 
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django_rest_passwordreset.models import ResetPasswordToken
+from rest_framework.test import APIClient
+
+from .cache import invalidate_sales
+from .export import encode_chunks
+from .outbox import send_batch
+from .management.commands.explain_queries import full_scans
+from .models import *
+from .routers import ReplicaRouter
+
+
+def make_user(username='user', role='client'):
+    return UserProfile.objects.create(
+        username=username,
+        email=f'{username}@example.com',
+        user_role=role,
+    )
+
+
+def make_store(owner=None):
+    owner = owner or make_user('seller', role='seller')
+    return Store.objects.create(store_owner=owner, store_name=f'Магазин {owner.username}')
+
+
+def make_subcategory(name='Мясо'):
+    category = Category.objects.create(category_name=f'Категория {name}', category_image='category_image/x.png')
+    return SubCategory.objects.create(category=category, subcategory_name=name, subcategory_image='subcategory_image/x.png')
+
+
+def make_product(store, subcategory, **kwargs):
+    kwargs.setdefault('product_name', 'Товар')
+    kwargs.setdefault('price', 100)
+    kwargs.setdefault('stock', 100)
+    return Product.objects.create(store=store, product_subcategory=subcategory, **kwargs)
+
+
+class ProductRatingStatsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(make_store(), make_subcategory())
+
+    def test_stats_follow_review_create_update_delete(self):
+        review = Review.objects.create(user=self.user, product=self.product, rating=5)
+        Review.objects.create(user=self.user, product=self.product, rating=2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum, self.product.good_rating_count), (2, 7, 1))
+        self.assertEqual(self.product.avg_rating, 3.5)
+        self.assertEqual(self.product.good_rate, '50%')
+
+        review.rating = 1
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum, self.product.good_rating_count), (2, 3, 0))
+
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum, self.product.good_rating_count), (1, 2, 0))
+        self.assertEqual(self.product.get_count_rating(), 1)
+
+    def test_stale_full_save_keeps_counters(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Review.objects.create(user=self.user, product=self.product, rating=5)
+        stale.price = 120
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum, self.product.good_rating_count), (1, 5, 1))
+        self.assertEqual(self.product.price, 120)
+
+    def test_rebuild_command(self):
+        Review.objects.create(user=self.user, product=self.product, rating=4)
+        Product.objects.update(rating_count=10, rating_sum=0, good_rating_count=0)
+
+        call_command('rebuild_rating_stats', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum, self.product.good_rating_count), (1, 4, 1))
+
+
+class ProductQueryCountTests(TestCase):
+    def setUp(self):
+        self.store = make_store()
+        self.subcategory = make_subcategory()
+        self.user = make_user()
+
+    def make_products(self, count):
+        for i in range(count):
+            product = make_product(self.store, self.subcategory, product_name=f'Товар {i}')
+            ProductImage.objects.create(product=product, product_image='product_image/x.jpg')
+            Review.objects.create(user=self.user, product=product, rating=5)
+
+    def test_product_list_query_count_is_constant(self):
+        self.make_products(1)
+        # товары + store (join) и одна выборка картинок
+        with self.assertNumQueries(2):
+            self.client.get('/products/')
+
+        self.make_products(30)
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/?page_size=50')
+        self.assertEqual(len(response.json()['results']), 31)
+
+    def test_product_detail_query_count(self):
+        self.make_products(1)
+        product = Product.objects.get()
+        # версия для ETag, товар + store и картинки
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/products/{product.pk}/')
+        self.assertEqual(response.json()['avg_rating'], 5.0)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        store, subcategory = make_store(), make_subcategory()
+        for i in range(25):
+            make_product(store, subcategory, product_name=f'Товар {i}', price=i % 5)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).json()
+            self.assertNotIn('OFFSET', queries.captured_queries[0]['sql'])
+            seen.extend(item['id'] for item in data['results'])
+            url = data['next']
+        return seen
+
+    def test_walks_all_pages_without_offset(self):
+        ids = self.walk('/products/?page_size=7')
+        self.assertEqual(ids, sorted(Product.objects.values_list('id', flat=True), reverse=True))
+
+    def test_price_ordering_is_stable_across_pages(self):
+        ids = self.walk('/products/?page_size=4&ordering=price')
+        expected = Product.objects.order_by('price', 'id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get('/products/?page_size=4&ordering=-price').json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        store, subcategory = make_store(), make_subcategory()
+        self.beef = make_product(store, subcategory, product_name='Говядина халяль', country='Кыргызстан',
+                                 description='Свежая говядина, говядина высшего сорта')
+        self.lamb = make_product(store, subcategory, product_name='Баранина', ingredients='баранина, говядина')
+        self.milk = make_product(store, subcategory, product_name='Молоко', country='Казахстан')
+
+    def search(self, query):
+        response = self.client.get('/products/', {'search': query})
+        return [item['id'] for item in response.json()['results']]
+
+    def test_results_are_ranked_and_cover_all_fields(self):
+        self.assertEqual(self.search('говядина'), [self.beef.pk, self.lamb.pk])
+        self.assertEqual(self.search('казахст'), [self.milk.pk])
+        self.assertEqual(self.search('"молоко*('), [self.milk.pk])
+        self.assertEqual(self.search('рыба'), [])
+
+    def test_ranked_results_paginate(self):
+        first = self.client.get('/products/', {'search': 'говядина', 'page_size': 1}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([first['results'][0]['id'], second['results'][0]['id']], [self.beef.pk, self.lamb.pk])
+        self.assertIsNone(second['next'])
+
+    def test_index_follows_product_changes(self):
+        self.milk.product_name = 'Кефир'
+        self.milk.save()
+        self.assertEqual(self.search('молоко'), [])
+        self.assertEqual(self.search('кефир'), [self.milk.pk])
+
+        self.lamb.delete()
+        self.assertEqual(self.search('говядина'), [self.beef.pk])
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = make_store()
+        self.meat, self.milk = make_subcategory('Мясо'), make_subcategory('Молочное')
+        make_product(self.store, self.meat, product_name='Говядина', country='KG', price=700)
+        make_product(self.store, self.meat, product_name='Баранина', country='KZ', price=900)
+        make_product(self.store, self.milk, product_name='Молоко', country='KG', price=80)
+
+    def test_counts_for_all_facets(self):
+        data = self.client.get('/products/facets/').json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['subcategories'][0], {'id': self.meat.pk, 'name': 'Мясо', 'count': 2})
+        self.assertEqual({row['country']: row['count'] for row in data['countries']}, {'KG': 2, 'KZ': 1})
+        self.assertEqual([row['count'] for row in data['price']], [1, 2, 0, 0])
+
+    def test_facets_respect_filters_and_search(self):
+        data = self.client.get('/products/facets/', {'search': 'говядина'}).json()
+        self.assertEqual(data['total'], 1)
+        data = self.client.get('/products/facets/', {'product_subcategory': self.milk.pk}).json()
+        self.assertEqual(data['countries'], [{'country': 'KG', 'count': 1}])
+
+    def test_unfiltered_facets_are_cached_until_products_change(self):
+        self.client.get('/products/facets/')
+        with self.assertNumQueries(0):
+            self.client.get('/products/facets/')
+
+        make_product(self.store, self.milk, product_name='Кефир', country='KG', price=90)
+        self.assertEqual(self.client.get('/products/facets/').json()['total'], 4)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = make_store()
+        self.meat = make_subcategory('Мясо')
+        make_product(self.store, self.meat)
+
+    def test_tree_is_cached_and_invalidated(self):
+        tree = self.client.get('/categories/tree/').json()
+        self.assertEqual(tree[0]['product_count'], 1)
+        self.assertEqual(tree[0]['subcategories'][0]['subcategory_name'], 'Мясо')
+
+        with self.assertNumQueries(0):
+            self.client.get('/categories/tree/')
+
+        make_product(self.store, self.meat)
+        SubCategory.objects.create(category=self.meat.category, subcategory_name='Птица',
+                                   subcategory_image='subcategory_image/x.png')
+        tree = self.client.get('/categories/tree/').json()
+        self.assertEqual(tree[0]['product_count'], 2)
+        self.assertEqual(len(tree[0]['subcategories']), 2)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.store = make_store()
+        self.product = make_product(self.store, make_subcategory())
+
+    def test_product_detail_revalidates_with_etag(self):
+        url = f'/products/{self.product.pk}/'
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Review.objects.create(user=make_user(), product=self.product, rating=5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_store_and_categories_honour_conditional_headers(self):
+        response = self.client.get(f'/stores/{self.store.pk}/')
+        response = self.client.get(f'/stores/{self.store.pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        etag = self.client.get('/categories/')['ETag']
+        self.assertEqual(self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Category.objects.get().delete()
+        self.assertEqual(self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_category_list_survives_delete_with_if_modified_since(self):
+        other = Category.objects.create(category_name='Другая')
+        response = self.client.get('/categories/')
+        self.assertNotIn('Last-Modified', response)
+
+        other.delete()
+        response = self.client.get('/categories/', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_missing_product_is_404(self):
+        self.assertEqual(self.client.get('/products/999/').status_code, 404)
+
+
+class ReviewThreadTests(TestCase):
+    def test_replies_are_attached_without_extra_queries(self):
+        author, replier = make_user('author'), make_user('replier')
+        product = make_product(make_store(), make_subcategory())
+        review = Review.objects.create(user=author, product=product, rating=5, comment='Отлично')
+        reply = Review.objects.create(user=replier, product=product, rating=5, comment='Согласен', parent=review)
+        CommentLike.objects.create(user=author, review=reply)
+
+        api = APIClient()
+        api.force_authenticate(author)
+        with self.assertNumQueries(2):
+            data = api.get(f'/reviews/{review.pk}/').json()
+        self.assertEqual(data['replies'], [{
+            'id': reply.pk, 'user_name': 'replier', 'comment': 'Согласен', 'rating': 5,
+            'likes_count': 1, 'parent_user_name': 'author',
+        }])
+
+
+class CommentLikeTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        product = make_product(make_store(), make_subcategory())
+        self.first = Review.objects.create(user=self.user, product=product, rating=5)
+        self.second = Review.objects.create(user=self.user, product=product, rating=4)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def test_counter_follows_like_rows(self):
+        like = CommentLike.objects.create(user=self.user, review=self.first)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes_count, 1)
+        like.delete()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes_count, 0)
+
+    def test_stale_full_save_keeps_likes_count(self):
+        stale = Review.objects.get(pk=self.first.pk)
+        like = CommentLike.objects.create(user=make_user('fan'), review=self.first)
+        stale.comment = 'Исправил отзыв'
+        stale.save()
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.likes_count, self.first.comment), (1, 'Исправил отзыв'))
+
+        like.delete()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.likes_count, 0)
+
+    def test_toggle_many_reviews_in_one_request(self):
+        CommentLike.objects.create(user=self.user, review=self.first)
+
+        response = self.api.post('/comments/toggle/', {'reviews': [self.first.pk, self.second.pk]}, format='json')
+        self.assertEqual(response.json(), [
+            {'review': self.first.pk, 'liked': False, 'likes_count': 0},
+            {'review': self.second.pk, 'liked': True, 'likes_count': 1},
+        ])
+        self.assertEqual(list(CommentLike.objects.values_list('review_id', flat=True)), [self.second.pk])
+
+        response = self.api.post('/comments/toggle/', {'reviews': [999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CartTotalsTests(TestCase):
+    def test_totals_are_computed_in_sql(self):
+        user = make_user()
+        store, subcategory = make_store(), make_subcategory()
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=make_product(store, subcategory, price='10.50'), quantity=2)
+        CartItem.objects.create(cart=cart, product=make_product(store, subcategory, price='3.00'), quantity=1)
+        api = APIClient()
+        api.force_authenticate(user)
+
+        with self.assertNumQueries(2):
+            data = api.get('/cart/').json()
+        self.assertEqual([item['total_price'] for item in data['items']], [21.0, 3.0])
+        self.assertEqual(data['total_price'], 24.0)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        store, subcategory = make_store(), make_subcategory()
+        self.products = [make_product(store, subcategory, price=10) for _ in range(30)]
+        self.cart = Cart.objects.create(user=self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def sync(self, items):
+        return self.api.post('/cart/batch/', {'items': items}, format='json')
+
+    def test_sets_updates_and_deletes_in_one_request(self):
+        keep, change, drop = self.products[:3]
+        CartItem.objects.create(cart=self.cart, product=keep, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=change, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=drop, quantity=1)
+
+        response = self.sync([
+            {'product': change.pk, 'quantity': 5},
+            {'product': drop.pk, 'quantity': 0},
+            {'product': self.products[3].pk, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(self.cart.items.values_list('product_id', 'quantity')),
+            {keep.pk: 1, change.pk: 5, self.products[3].pk: 2},
+        )
+        self.assertEqual(response.json()['total_price'], 80.0)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        def queries(items):
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.sync(items).status_code, 200)
+            return len(captured)
+
+        small = queries([{'product': self.products[0].pk, 'quantity': 1}])
+        large = queries([{'product': p.pk, 'quantity': 3} for p in self.products[1:]])
+        self.assertEqual(small, large)
+
+    def test_unknown_product_is_rejected(self):
+        self.assertEqual(self.sync([{'product': 999, 'quantity': 1}]).status_code, 400)
+
+
+class EffectivePriceTests(TestCase):
+    def setUp(self):
+        store, subcategory = make_store(), make_subcategory()
+        self.cheap = make_product(store, subcategory, price=100)
+        self.discounted = make_product(store, subcategory, price=300)
+        now = timezone.now()
+        self.sale = Sale.objects.create(
+            product=self.discounted, is_active=True, description1='-', description2='-', discount_percent=50,
+            start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1),
+        )
+
+    def test_sale_changes_effective_price(self):
+        self.discounted.refresh_from_db()
+        self.assertEqual((self.discounted.effective_price, self.discounted.active_sale_id), (Decimal('150.00'), self.sale.pk))
+
+        self.discounted.price = 200
+        self.discounted.save()
+        self.discounted.refresh_from_db()
+        self.assertEqual(self.discounted.effective_price, Decimal('100.00'))
+
+        self.sale.delete()
+        self.discounted.refresh_from_db()
+        self.assertEqual((self.discounted.effective_price, self.discounted.active_sale_id), (Decimal('200.00'), None))
+
+    def test_stale_save_keeps_active_sale(self):
+        # экземпляр прочитан до того, как акция начала действовать
+        stale = Product.objects.get(pk=self.cheap.pk)
+        sale = Sale.objects.create(
+            product=self.cheap, is_active=True, description1='-', description2='-', discount_percent=50,
+            start_date=timezone.now() - timedelta(hours=1), end_date=timezone.now() + timedelta(hours=1),
+        )
+        stale.product_name = 'Новое имя'
+        stale.save()
+        self.cheap.refresh_from_db()
+        self.assertEqual((self.cheap.effective_price, self.cheap.active_sale_id), (Decimal('50.00'), sale.pk))
+
+        stale.price = 80
+        stale.save(update_fields=['price'])
+        self.cheap.refresh_from_db()
+        self.assertEqual(self.cheap.effective_price, Decimal('40.00'))
+
+    def test_moving_sale_restores_previous_product(self):
+        self.sale.product = self.cheap
+        self.sale.save()
+        self.discounted.refresh_from_db()
+        self.cheap.refresh_from_db()
+        self.assertEqual((self.discounted.effective_price, self.discounted.active_sale_id), (Decimal('300.00'), None))
+        self.assertEqual((self.cheap.effective_price, self.cheap.active_sale_id), (Decimal('50.00'), self.sale.pk))
+
+    def test_filter_and_order_by_effective_price(self):
+        ids = [p['id'] for p in self.client.get('/products/', {'ordering': '-effective_price'}).json()['results']]
+        self.assertEqual(ids, [self.discounted.pk, self.cheap.pk])
+        ids = [p['id'] for p in self.client.get('/products/', {'effective_price__lt': 120}).json()['results']]
+        self.assertEqual(ids, [self.cheap.pk])
+
+    def test_job_restores_price_after_sale_ends(self):
+        Sale.objects.filter(pk=self.sale.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        call_command('refresh_effective_prices', stdout=StringIO())
+        self.discounted.refresh_from_db()
+        self.assertEqual((self.discounted.effective_price, self.discounted.active_sale_id), (Decimal('300.00'), None))
+
+
+class SaleSchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(make_store(), make_subcategory(), price=100)
+        now = timezone.now()
+        self.sale = Sale.objects.create(
+            product=self.product, is_active=True, description1='-', description2='-', discount_percent=20,
+            start_date=now + timedelta(hours=1), end_date=now + timedelta(hours=2),
+        )
+
+    def sale_ids(self):
+        return [sale['id'] for sale in self.client.get('/sales/').json()['results']]
+
+    def test_scheduler_flips_sales_at_boundaries(self):
+        self.assertEqual(self.sale_ids(), [])
+        with self.assertNumQueries(0):
+            self.sale_ids()
+
+        start = timezone.now() + timedelta(hours=1, minutes=30)
+        self.assertEqual(Sale.sync_live_flags(start), {self.product.pk})
+        invalidate_sales()
+        self.assertEqual(self.sale_ids(), [self.sale.pk])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('80.00'))
+
+        Sale.objects.filter(pk=self.sale.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        call_command('run_sale_scheduler', stdout=StringIO())
+        self.assertEqual(self.sale_ids(), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal('100.00'))
+
+    def test_editing_a_sale_resets_cached_list(self):
+        self.assertEqual(self.sale_ids(), [])
+        self.sale.start_date = timezone.now() - timedelta(minutes=1)
+        self.sale.save()
+        self.assertEqual(self.sale_ids(), [self.sale.pk])
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.store, self.subcategory = make_store(), make_subcategory()
+        self.cart = Cart.objects.create(user=self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def fill_cart(self, count):
+        for i in range(count):
+            product = make_product(self.store, self.subcategory, price='200.00')
+            CartItem.objects.create(cart=self.cart, product=product, quantity=i + 1)
+
+    def checkout(self):
+        return self.api.post('/checkout/', {'address': 'Бишкек', 'phone_number': '+996700000000'}, format='json')
+
+    def test_cart_becomes_order_with_price_snapshot(self):
+        self.fill_cart(2)
+        discounted = CartItem.objects.first().product
+        now = timezone.now()
+        Sale.objects.create(product=discounted, is_active=True, description1='-', description2='-',
+                            discount_percent=25, start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1))
+
+        # корзина показывает ту же сумму, что спишет checkout
+        cart = self.api.get('/cart/').json()
+        self.assertEqual(sorted(item['product_price'] for item in cart['items']), [150.0, 200.0])
+        self.assertEqual(cart['total_price'], 150.0 + 200.0 * 2)
+
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(customer=self.user)
+        prices = dict(order.items.values_list('product_id', 'price'))
+        self.assertEqual(prices[discounted.pk], Decimal('150.00'))
+        self.assertEqual(sorted(prices.values()), [Decimal('150.00'), Decimal('200.00')])
+        self.assertFalse(self.cart.items.exists())
+
+        # повторный клик: корзина уже пуста
+        self.assertEqual(self.checkout().status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        def checkout_queries(count):
+            self.fill_cart(count)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.checkout().status_code, 201)
+            return len(queries)
+
+        self.assertEqual(checkout_queries(1), checkout_queries(20))
+
+
+class StockTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(make_store(), make_subcategory(), stock=3)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def checkout(self, quantity):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        return self.api.post('/checkout/', {'address': 'Бишкек'}, format='json')
+
+    def test_take_stock_is_all_or_nothing(self):
+        other = make_product(self.product.store, self.product.product_subcategory, stock=1)
+        self.assertFalse(Product.take_stock({self.product.pk: 2, other.pk: 5}))
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('stock', flat=True)), [3, 1])
+        self.assertTrue(Product.take_stock({self.product.pk: 2, other.pk: 1}))
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('stock', flat=True)), [1, 0])
+
+    def test_checkout_reserves_and_rejects_oversell(self):
+        self.assertEqual(self.checkout(2).status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+
+        CartItem.objects.all().delete()
+        self.assertEqual(self.checkout(2).status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_reservation_is_released_and_order_cancelled(self):
+        self.checkout(2)
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(Order.objects.get().status, 'cancelled')
+
+    def test_shipped_order_consumes_reservation(self):
+        self.checkout(2)
+        order = Order.objects.get()
+        order.status = 'shipped'
+        order.save()
+        self.assertFalse(StockReservation.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+
+    def test_stale_full_save_keeps_reserved_stock(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.checkout(2)
+        stale.product_name = 'Новое имя'
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.product_name), (1, 'Новое имя'))
+
+        # правка остатка продавцом ложится поверх текущего значения, а не затирает его
+        stale.stock += 5
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+
+    def test_stale_stock_edit_below_reserved_is_clamped(self):
+        self.product.stock = 10
+        self.product.save(update_fields=['stock'])
+        stale = Product.objects.get(pk=self.product.pk)
+        self.assertTrue(Product.take_stock({self.product.pk: 8}))
+
+        # продавец обнуляет остаток в форме, открытой до checkout: 2 + (0 - 10) не должно падать на CHECK
+        stale.stock = 0
+        stale.product_name = 'B2'
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.product_name), (0, 'B2'))
+
+    def test_stock_change_invalidates_product_etag(self):
+        url = f'/products/{self.product.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertTrue(Product.take_stock({self.product.pk: 1}))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    def test_parallel_decrements_never_oversell(self):
+        product = make_product(make_store(), make_subcategory(), stock=20)
+        successes = []
+
+        def buyer():
+            try:
+                for _ in range(5):
+                    while True:
+                        try:
+                            if Product.take_stock({product.pk: 1}):
+                                successes.append(1)
+                            break
+                        except OperationalError:
+                            # SQLite: таблица занята другим писателем — повторяем
+                            continue
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(len(successes), 20)
+
+
+class BenchmarkWritesTests(TransactionTestCase):
+    def test_benchmark_runs_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_writes', '--workers', '3', '--ops', '5', stdout=out)
+        # тестовая БД SQLite в памяти с shared cache не ждёт busy timeout, поэтому ошибки
+        # тут возможны; число успешных операций сравнивают на файловой БД или PostgreSQL
+        self.assertIn('cart:', out.getvalue())
+        self.assertIn('review:', out.getvalue())
+        self.assertFalse(UserProfile.objects.exists())
+        self.assertFalse(Product.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    """Реплика — отдельный файл SQLite; replicate() снимает с primary копию через VACUUM INTO."""
+
+    def setUp(self):
+        cache.clear()
+        self.replica_path = os.path.join(tempfile.mkdtemp(), 'replica.sqlite3')
+        # соединение без записи в DATABASES: тестовый раннер не создаёт и не очищает для него БД
+        connections['replica'] = connections['default'].__class__(
+            {**connections.settings['default'], 'NAME': self.replica_path}, alias='replica',
+        )
+        self.addCleanup(self.drop_replica)
+
+        self.product = make_product(make_store(), make_subcategory())
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+
+    def drop_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        shutil.rmtree(os.path.dirname(self.replica_path))
+
+    def replicate(self):
+        connections['replica'].close()
+        if os.path.exists(self.replica_path):
+            os.remove(self.replica_path)
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [self.replica_path])
+
+    def reviews(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return [review['comment'] for review in api.get(f'/reviews/?product={self.product.pk}').json()['results']]
+
+    def test_reads_go_to_replica_and_writer_sticks_to_primary(self):
+        Review.objects.create(user=self.reader, product=self.product, rating=5, comment='старый')
+        self.replicate()
+
+        api = APIClient()
+        api.force_authenticate(self.author)
+        response = api.post('/reviews/', {'product_id': self.product.pk, 'rating': 4, 'comment': 'новый'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # реплика ещё не догнала primary: автор видит свой отзыв, остальные пока нет
+        self.assertEqual(sorted(self.reviews(self.author)), ['новый', 'старый'])
+        self.assertEqual(self.reviews(self.reader), ['старый'])
+
+        cache.clear()  # окно REPLICA_STICKY_SECONDS прошло
+        self.assertEqual(self.reviews(self.author), ['старый'])
+
+    def test_only_catalog_reads_inside_requests_use_replica(self):
+        self.replicate()
+        fresh = make_product(self.product.store, self.product.product_subcategory, product_name='Новинка')
+
+        product_ids = [product['id'] for product in self.client.get('/products/').json()['results']]
+        self.assertEqual(product_ids, [self.product.pk])
+        # вне HTTP-запроса (команды, воркеры) и для не-каталожных моделей — всегда primary
+        self.assertEqual(ReplicaRouter().db_for_read(Product), 'default')
+        self.assertEqual(Product.objects.get(pk=fresh.pk).product_name, 'Новинка')
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.product = make_product(make_store(), make_subcategory())
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def post(self, url, data, key):
+        return self.api.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_cart_post_is_applied_once(self):
+        first = self.post('/cart_create/', {'product': self.product.pk, 'quantity': 2}, 'abc')
+        retry = self.post('/cart_create/', {'product': self.product.pk, 'quantity': 2}, 'abc')
+
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+        self.post('/cart_create/', {'product': self.product.pk, 'quantity': 2}, 'other')
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+    def test_retried_checkout_returns_the_same_order(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+
+        first = self.post('/checkout/', {'address': 'Бишкек'}, 'order-1')
+        retry = self.post('/checkout/', {'address': 'Бишкек'}, 'order-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json()['id'], first.json()['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_in_flight_and_reused_keys(self):
+        IdempotencyKey.objects.create(user=self.user, key='busy', request_path='/favorite_create/')
+        self.assertEqual(self.post('/favorite_create/', {'product': self.product.pk}, 'busy').status_code, 409)
+        self.assertEqual(self.post('/checkout/', {'address': 'Бишкек'}, 'busy').status_code, 422)
+
+    def test_abandoned_in_flight_key_is_rerun(self):
+        IdempotencyKey.objects.create(user=self.user, key='crashed', request_path='/favorite_create/')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.post('/favorite_create/', {'product': self.product.pk}, 'crashed')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key='crashed').status_code, 201)
+
+    def test_failed_request_can_be_retried_and_keys_expire(self):
+        self.assertEqual(self.post('/checkout/', {'address': 'Бишкек'}, 'empty').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.filter(key='empty').exists())
+
+        self.post('/favorite_create/', {'product': self.product.pk}, 'fav')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_duplicate_favorite_is_rejected(self):
+        self.api.post('/favorite_create/', {'product': self.product.pk}, format='json')
+        response = self.api.post('/favorite_create/', {'product': self.product.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class MyOrdersTests(TestCase):
+    def setUp(self):
+        self.user = make_user('buyer')
+        self.other = make_user('other')
+        self.product = make_product(make_store(), make_subcategory(), product_name='Сыр')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def make_order(self, customer, status='pending', days_ago=0):
+        order = Order.objects.create(customer=customer, status=status)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        OrderItem.objects.create(order=order, product=self.product, address='Бишкек', quantity=1, price=100)
+        return order
+
+    def ids(self, query=''):
+        response = self.api.get('/my-orders/' + query)
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.json()['results']]
+
+    def test_only_own_orders_newest_first(self):
+        old = self.make_order(self.user, days_ago=3)
+        new = self.make_order(self.user)
+        self.make_order(self.other)
+        self.assertEqual(self.ids(), [new.pk, old.pk])
+
+        item = self.api.get('/my-orders/').json()['results'][0]['items'][0]
+        self.assertEqual(item['product_items'], {'id': self.product.pk, 'product_name': 'Сыр'})
+
+    def test_filters_by_status_and_date(self):
+        shipped = self.make_order(self.user, status='shipped', days_ago=5)
+        pending = self.make_order(self.user)
+        self.assertEqual(self.ids('?status=shipped'), [shipped.pk])
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.ids(f'?created_from={since}'), [pending.pk])
+        until = (timezone.localtime() - timedelta(days=5)).date().isoformat()
+        self.assertEqual(self.ids(f'?created_from={until}&created_to={until}'), [shipped.pk])
+
+        # диапазон по самой колонке, без приведения к дате — иначе индекс (customer, created_at) не работает
+        with CaptureQueriesContext(connection) as queries:
+            self.ids(f'?created_from={since}&created_to={since}')
+        self.assertFalse([q['sql'] for q in queries.captured_queries if 'cast_date' in q['sql']])
+
+    def test_pages_do_not_overlap(self):
+        orders = [self.make_order(self.user, days_ago=day) for day in range(5)]
+        first = self.api.get('/my-orders/?page_size=3').json()
+        second = self.api.get(first['next']).json()
+        ids = [order['id'] for order in first['results'] + second['results']]
+        self.assertEqual(ids, [order.pk for order in orders])
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get('/my-orders/').status_code, 401)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.seller = make_user('seller', role='seller')
+        self.store = make_store(self.seller)
+        self.cheese = make_product(self.store, make_subcategory(), product_name='Сыр')
+        self.milk = make_product(self.store, make_subcategory('Молочка'), product_name='Молоко')
+        self.buyer = make_user('buyer')
+        self.api = APIClient()
+        self.api.force_authenticate(self.seller)
+
+    def order(self, when, *lines):
+        order = Order.objects.create(customer=self.buyer)
+        Order.objects.filter(pk=order.pk).update(created_at=when)
+        for product, quantity, price in lines:
+            OrderItem.objects.create(order=order, product=product, address='Бишкек', quantity=quantity, price=price)
+        order.refresh_from_db()
+        return order
+
+    def report(self, **params):
+        response = self.api.get(f'/stores/{self.store.pk}/analytics/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_incremental_rollup(self):
+        now = timezone.now()
+        self.order(now - timedelta(days=2), (self.cheese, 2, 100), (self.milk, 1, 50))
+        self.order(now - timedelta(days=2), (self.milk, 4, 50))
+        call_command('rollup_sales', stdout=StringIO())
+
+        report = self.report()
+        self.assertEqual(report['revenue'], '450.00')
+        self.assertEqual(report['units'], 7)
+        self.assertEqual(report['orders_count'], 2)
+        self.assertEqual([p['product_name'] for p in report['top_products']], ['Молоко', 'Сыр'])
+
+        # второй прогон читает только новые заказы и не задваивает старые дни
+        self.order(timezone.now(), (self.cheese, 1, 100))
+        call_command('rollup_sales', stdout=StringIO())
+        report = self.report()
+        self.assertEqual(report['revenue'], '550.00')
+        self.assertEqual(len(report['days']), 2)
+        self.assertEqual(report['top_products'][0]['product_name'], 'Сыр')
+
+    def test_cancelled_order_rewinds_watermark(self):
+        order = self.order(timezone.now() - timedelta(days=3), (self.cheese, 1, 100))
+        call_command('rollup_sales', stdout=StringIO())
+        self.assertEqual(self.report()['revenue'], '100.00')
+
+        order.status = 'cancelled'
+        order.save()
+        call_command('rollup_sales', stdout=StringIO())
+        self.assertEqual(self.report()['revenue'], '0.00')
+
+    def test_expired_reservation_sweep_rewinds_watermark(self):
+        order = self.order(timezone.now() - timedelta(days=3), (self.cheese, 1, 100))
+        StockReservation.objects.create(order=order, product=self.cheese, quantity=1,
+                                        expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('rollup_sales', stdout=StringIO())
+        self.assertEqual(self.report()['revenue'], '100.00')
+
+        call_command('release_expired_reservations', stdout=StringIO())
+        call_command('rollup_sales', stdout=StringIO())
+        self.assertEqual(self.report()['revenue'], '0.00')
+
+    def test_reads_only_rollups(self):
+        self.order(timezone.now(), (self.cheese, 1, 100))
+        call_command('rollup_sales', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            self.report(date_from='2000-01-01')
+        self.assertFalse(any('market_orderitem' in query['sql'] for query in queries.captured_queries))
+
+    def test_only_owner_sees_analytics(self):
+        self.api.force_authenticate(self.buyer)
+        self.assertEqual(self.api.get(f'/stores/{self.store.pk}/analytics/').status_code, 403)
+        self.api.force_authenticate(self.seller)
+        response = self.api.get(f'/stores/{self.store.pk}/analytics/', {'date_from': '2026-02-01', 'date_to': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StoreExportTests(TestCase):
+    def setUp(self):
+        self.seller = make_user('seller', role='seller')
+        store = make_store(self.seller)
+        self.product = make_product(store, make_subcategory(), product_name='Сыр, твёрдый')
+        other = make_user('other_seller', role='seller')
+        make_product(make_store(other), make_subcategory('Чужая'), product_name='Чужой товар')
+        order = Order.objects.create(customer=make_user('buyer'))
+        OrderItem.objects.create(order=order, product=self.product, address='Бишкек', quantity=2, price=90)
+        self.api = APIClient()
+        self.api.force_authenticate(self.seller)
+
+    def download(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_contains_only_own_products(self):
+        response, body = self.download('/stores/export/products.csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="products.csv"')
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0][:2], ['id', 'product_name'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Сыр, твёрдый'])
+
+    def test_gzipped_jsonl_order_items(self):
+        response, body = self.download('/stores/export/order-items.jsonl?gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        item = json.loads(lines[0])
+        self.assertEqual((item['product_name'], item['quantity'], item['customer']), ('Сыр, твёрдый', 2, 'buyer'))
+
+    def test_large_export_is_flushed_in_chunks(self):
+        lines = (f'{i},{"x" * 100}\n' for i in range(2000))
+        chunks = list(encode_chunks(lines, gzip=True))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(len(gzip.decompress(b''.join(chunks)).splitlines()), 2000)
+
+    def test_unknown_dataset_and_buyers_are_rejected(self):
+        self.assertEqual(self.api.get('/stores/export/users.csv').status_code, 404)
+        self.assertEqual(self.api.get('/stores/export/products.xml').status_code, 404)
+        self.api.force_authenticate(make_user('buyer2'))
+        self.assertEqual(self.api.get('/stores/export/products.csv').status_code, 403)
+
+
+class ExplainQueriesTests(TestCase):
+    def test_parses_full_scans(self):
+        self.assertEqual(full_scans('SCAN market_sale\nSEARCH market_product USING INTEGER PRIMARY KEY', 'sqlite'),
+                         ['market_sale'])
+        self.assertEqual(full_scans('SCAN market_sale USING INDEX sale_live_idx', 'sqlite'), [])
+        self.assertEqual(full_scans('Seq Scan on market_order  (cost=0.00..1.01)', 'postgresql'), ['market_order'])
+
+    def test_hot_paths_use_indexes(self):
+        out = StringIO()
+        call_command(
+            'explain_queries', '/clients/', '/sellers/', '/sales/', '/products/?price__gt=100&ordering=price',
+            '--fail', stdout=out,
+        )
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+    def test_flags_filter_that_cannot_use_index(self):
+        out = StringIO()
+        # диапазон по цене при сортировке по id: индекс по price тут не помогает
+        with self.assertRaises(CommandError):
+            call_command('explain_queries', '/products/?price__gt=100', '--fail', stdout=out)
+
+
+class AsyncCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        store, subcategory = make_store(), make_subcategory()
+        self.products = [make_product(store, subcategory, product_name=f'Товар {i}', price=100 + i) for i in range(3)]
+        ProductImage.objects.create(product=self.products[0], product_image='product_image/x.jpg')
+        now = timezone.now()
+        Sale.objects.create(
+            product=self.products[1], is_active=True, description1='-', description2='-', discount_percent=10,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+        )
+
+    async def test_same_payload_as_sync_views(self):
+        for sync_url, async_url in (
+            ('/products/', '/async/products/'),
+            ('/categories/', '/async/categories/'),
+            ('/stores/', '/async/stores/'),
+            ('/sales/', '/async/sales/'),
+        ):
+            with self.subTest(url=async_url):
+                sync_response = await self.async_client.get(sync_url)
+                async_response = await self.async_client.get(async_url)
+                self.assertEqual(async_response.status_code, 200)
+                self.assertEqual(async_response.json()['results'], sync_response.json()['results'])
+
+        pk = self.products[0].pk
+        sync_detail = (await self.async_client.get(f'/products/{pk}/')).json()
+        self.assertEqual((await self.async_client.get(f'/async/products/{pk}/')).json(), sync_detail)
+        self.assertEqual((await self.async_client.get('/async/products/0/')).status_code, 404)
+
+    async def test_pagination_filters_and_query_count(self):
+        response = await self.async_client.get('/async/products/?page_size=2&price__gt=100')
+        data = response.json()
+        self.assertEqual([p['product_name'] for p in data['results']], ['Товар 2', 'Товар 1'])
+        self.assertIsNone(data['next'])
+        # страница и картинки — два запроса, посчитанные middleware и в async-режиме
+        self.assertEqual(response['X-DB-Queries'], '2')
+
+        first = (await self.async_client.get('/async/products/?page_size=2')).json()
+        second = (await self.async_client.get(first['next'])).json()
+        self.assertEqual([p['product_name'] for p in second['results']], ['Товар 0'])
+        self.assertIsNotNone(second['previous'])
+        self.assertEqual((await self.async_client.get('/async/stores/?cursor=x')).status_code, 404)
+
+    async def test_search_and_ordering_match_sync_view(self):
+        for params in ({'search': 'товар'}, {'ordering': 'effective_price'}, {'ordering': '-price'}, {'ordering': 'stock'}):
+            with self.subTest(params=params):
+                expected = [p['id'] for p in (await self.async_client.get('/products/', params)).json()['results']]
+                first = (await self.async_client.get('/async/products/', {**params, 'page_size': 2})).json()
+                second = (await self.async_client.get(first['next'])).json()
+                self.assertEqual([p['id'] for p in first['results'] + second['results']], expected)
+                self.assertIsNone(second['next'])
+
+                # курсор у sync и async один и тот же
+                sync_second = (await self.async_client.get('/products/?' + first['next'].split('?')[1])).json()
+                self.assertEqual(sync_second['results'], second['results'])
+
+    async def test_concurrent_requests_count_only_their_queries(self):
+        responses = await asyncio.gather(*(self.async_client.get('/async/products/') for _ in range(20)))
+        self.assertEqual({response['X-DB-Queries'] for response in responses}, {'2'})
+
+
+class CountingBackend(locmem.EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class BrokenBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise smtplib.SMTPServerDisconnected('connection lost')
+
+
+class OutboxEmailTests(TestCase):
+    def setUp(self):
+        self.user = make_user('forgetful')
+
+    def request_reset(self):
+        response = self.client.post('/password_reset/', {'email': self.user.email})
+        self.assertEqual(response.status_code, 200)
+
+    def test_reset_is_queued_not_sent_in_request(self):
+        self.request_reset()
+        self.assertEqual(mail.outbox, [])
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.to, self.user.email)
+        self.assertIn(ResetPasswordToken.objects.get(user=self.user).key, email.body)
+
+        call_command('send_outbox_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.SENT)
+
+    @override_settings(EMAIL_BACKEND='market.tests.CountingBackend')
+    def test_batch_reuses_one_connection(self):
+        for i in range(5):
+            OutboxEmail.enqueue('Тема', f'Письмо {i}', 'noreply@example.com', [f'user{i}@example.com'])
+        CountingBackend.opened = 0
+        call_command('send_outbox_emails', '--batch-size', '3', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingBackend.opened, 2)
+
+    @override_settings(EMAIL_BACKEND='market.tests.BrokenBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        email = OutboxEmail.enqueue('Тема', 'Текст', 'noreply@example.com', ['user@example.com'])
+        self.assertEqual(send_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('connection lost', email.last_error)
+
+        # до конца паузы письмо не берётся
+        self.assertEqual(send_batch(), (0, 0))
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.FAILED)
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов на list-эндпоинтах не должно зависеть от числа строк."""
+
+    list_urls = (
+        '/clients/', '/sellers/', '/admins/',
+        '/stores/', '/stores_create/',
+        '/categories/', '/subcategories/',
+        '/products/', '/products_create/',
+        '/productsimage/', '/productsimage_create/',
+        '/sales/', '/orders/', '/my-orders/', '/order-items/',
+        '/reviews/', '/comments/',
+        '/cart/', '/favorite/', '/seller_requests/',
+    )
+
+    def setUp(self):
+        self.seller = make_user('main_seller', role='seller')
+        self.store = make_store(self.seller)
+        self.api = APIClient()
+        self.api.force_authenticate(self.seller)
+        self.seeded = 0
+
+    def seed(self, rows):
+        now = timezone.now()
+        cart, _ = Cart.objects.get_or_create(user=self.seller)
+        favorite, _ = Favorite.objects.get_or_create(user=self.seller)
+        for i in range(self.seeded, self.seeded + rows):
+            client = make_user(f'client{i}')
+            seller = make_user(f'seller{i}', role='seller')
+            make_store(seller)
+            subcategory = make_subcategory(f'Подкатегория {i}')
+            product = make_product(self.store, subcategory, product_name=f'Товар {i}')
+            ProductImage.objects.create(product=product, product_image='product_image/x.jpg')
+            Sale.objects.create(
+                product=product, is_active=True, description1='-', description2='-', discount_percent=10,
+                start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+            )
+            order = Order.objects.create(customer=client)
+            OrderItem.objects.create(order=order, product=product, address='Бишкек', quantity=1, price=100)
+            own_order = Order.objects.create(customer=self.seller)
+            OrderItem.objects.create(order=own_order, product=product, address='Бишкек', quantity=1, price=100)
+            review = Review.objects.create(user=client, product=product, rating=5, comment='Хорошо')
+            Review.objects.create(user=self.seller, product=product, rating=5, comment='Спасибо', parent=review)
+            CommentLike.objects.create(user=client, review=review)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+            FavoriteProduct.objects.create(favorite=favorite, product=product)
+            SellerRequest.objects.create(user=client, phone_number='+996700000000')
+        self.seeded += rows
+
+    def query_counts(self):
+        counts = {}
+        for url in self.list_urls:
+            response = self.api.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = int(response['X-DB-Queries'])
+        return counts
+
+    def test_response_has_db_headers(self):
+        response = self.api.get('/products/')
+        self.assertIn('X-DB-Queries', response)
+        self.assertTrue(response['X-DB-Time'].endswith('ms'))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.seed(1)
+        small = self.query_counts()
+        self.seed(99)
+        large = self.query_counts()
+
+        for url in self.list_urls:
+            with self.subTest(url=url):
+                self.assertEqual(small[url], large[url])
@@ -2,6 +2,7 @@ from rest_framework import routers
 from unicodedata import category
 
 from .views import *
+from . import async_views
 from django.urls import path, include
 
 router = routers.SimpleRouter()
@@ -17,17 +18,21 @@ urlpatterns = [
     # Store
     path('stores/', StoreAPIView.as_view(), name='store-list'),
     path('stores/<int:pk>/', StoreDetailAPIView.as_view(), name='store-detail'),
+    path('stores/<int:pk>/analytics/', StoreAnalyticsAPIView.as_view(), name='store-analytics'),
+    path('stores/export/<slug:dataset>.<slug:fmt>', StoreExportAPIView.as_view(), name='store-export'),
     path('stores_create/',StoreCreateAPIView.as_view(), name='store-create'),
 
 
     #  Categories
     path('categories/', CategoryListAPIView.as_view(), name='category-list'),
+    path('categories/tree/', CategoryTreeAPIView.as_view(), name='category-tree'),
     path('categories/<int:pk>/',CategoryDetailAPIView.as_view(), name='category-detail'),
     path('subcategories/', SubCategoryListApiView.as_view(), name='subcategory-list'),
     path('subcategories/<int:pk>/',SubCategoryDetailApiView.as_view(), name='subcategory-detail'),
 
     # Products
     path('products/', ProductListAPIView.as_view(), name='product-list'),
+    path('products/facets/', ProductFacetAPIView.as_view(), name='product-facets'),
     path('products_create/', ProductCreateAPIView.as_view(), name='product-create'),
     path('products/<int:pk>/', ProductDetailAPIView.as_view(), name='product-detail'),
 
@@ -39,18 +44,29 @@ urlpatterns = [
     path('sales/', SaleListAPIView.as_view(), name='sale-list'),
     path('sales/<int:pk>/', SaleDetailAPIView.as_view(), name='sale-detail'),
 
+    # async-версии каталога для ASGI (market/async_views.py)
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/stores/', async_views.store_list, name='async-store-list'),
+    path('async/sales/', async_views.sale_list, name='async-sale-list'),
+
     # Orders
     path('orders/', OrderAPIView.as_view(), name='order-list'),
+    path('my-orders/', MyOrderAPIView.as_view(), name='my-order-list'),
     path('order-items/', OrderItemAPIView.as_view(), name='order-item-list'),
 
     # Reviews & Comments
     path('reviews/', ReviewListAPIView.as_view(), name='review-list'),
     path('reviews/<int:pk>/', ReviewDetailAPIView.as_view(), name='review-detail'),
     path('comments/', CommentListAPIView.as_view(), name='comment-list'),
+    path('comments/toggle/', CommentLikeToggleAPIView.as_view(), name='comment-toggle'),
     # cart карзина
     path('cart/', CartAPIView.as_view(),name = 'bilal_cart'),
     path('cart_create/', CartItemCreateAPIView.as_view(),name = 'cart_item_create'),
     path('cart/<int:pk>/', CartItemDetailAPIView.as_view(),name = 'cart_item_detail'),
+    path('cart/batch/', CartBatchAPIView.as_view(), name='cart_batch'),
+    path('checkout/', CheckoutAPIView.as_view(), name='checkout'),
 
     # favorite
 
@@ -5,11 +5,22 @@ from rest_framework import status, viewsets, generics, permissions, response
 from .models import *
 from .permissions import *
 from .filters import *
+from .pagination import *
+from .cache import *
+from .analytics import store_report
+from .export import CONTENT_TYPES, DATASETS, export_stream
+from .mixins import *
 from  django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django.utils import timezone
+from rest_framework.filters import OrderingFilter
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view
 
@@ -84,23 +95,82 @@ class StoreAPIView(generics.ListAPIView):
     queryset = Store.objects.all()
     serializer_class = StoreListSerializer
 
-class StoreDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class StoreDetailAPIView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Store.objects.all()
     serializer_class = StoreDetailSerializer
 
+    def get_resource_version(self):
+        updated_at = Store.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return updated_at, f'store:{self.kwargs["pk"]}:{updated_at.isoformat()}'
+
+
+class StoreAnalyticsAPIView(generics.GenericAPIView):
+    # читает только дневные агрегаты, которые досчитывает команда rollup_sales
+    queryset = Store.objects.all()
+    serializer_class = StoreAnalyticsSerializer
+    permission_classes = (permissions.IsAuthenticated, IsStoreOwnerOrAdmin)
+
+    def get(self, request, *args, **kwargs):
+        store = self.get_object()
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        report = store_report(store.pk, params.validated_data['date_from'], params.validated_data['date_to'])
+        return Response(self.get_serializer(report).data)
+
+
+class StoreExportAPIView(APIView):
+    """Выгрузка товаров или позиций заказов своего магазина потоком, ?gzip=1 — со сжатием."""
+    permission_classes = (IsSeller,)
 
-class CategoryListAPIView(generics.ListCreateAPIView):
+    def get(self, request, dataset, fmt):
+        if dataset not in DATASETS or fmt not in CONTENT_TYPES:
+            raise NotFound('Неизвестный формат выгрузки')
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+        response = StreamingHttpResponse(
+            export_stream(dataset, fmt, request.user, gzip=gzip),
+            content_type='application/gzip' if gzip else CONTENT_TYPES[fmt],
+        )
+        filename = f'{dataset}.{fmt}.gz' if gzip else f'{dataset}.{fmt}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class CategoryListAPIView(ConditionalGetMixin, generics.ListCreateAPIView):
     queryset = Category.objects.all()
     serializer_class = CategoryListSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
+    def get_resource_version(self):
+        # count ловит удаления, которые не двигают max(updated_at), поэтому
+        # Last-Modified для списка не отдаём: If-Modified-Since после удаления ответил бы 304
+        stats = Category.objects.aggregate(last=Max('updated_at'), count=Count('id'))
+        if stats['last'] is None:
+            return None
+        return None, f'categories:{stats["count"]}:{stats["last"].isoformat()}'
+
+class CategoryTreeAPIView(APIView):
+
+    def get(self, request, *args, **kwargs):
+        tree = cache.get(CATEGORY_TREE_KEY)
+        if tree is None:
+            categories = Category.objects.order_by('id').prefetch_related(
+                Prefetch('subcategories', queryset=SubCategory.objects.annotate(
+                    product_count=Count('product')).order_by('id'))
+            )
+            # без request в контексте картинки отдаются относительными путями — так кэш не зависит от хоста
+            tree = CategoryTreeSerializer(categories, many=True).data
+            cache.set(CATEGORY_TREE_KEY, tree, CATEGORY_TREE_TIMEOUT)
+        return Response(tree)
+
 class CategoryDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Category.objects.prefetch_related('subcategories')
     serializer_class = CategoryDetailSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
 class SubCategoryListApiView(generics.ListCreateAPIView):
-    queryset = SubCategory.objects.all()
+    queryset = SubCategory.objects.select_related('category')
     serializer_class = SubCategoryListSerializers
     permission_classes = (IsAdminOrReadOnly,)
 
@@ -117,7 +187,7 @@ class ProductCreateAPIView(generics.ListCreateAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.is_authenticated and user.user_role == 'seller':
-            return Product.objects.filter(store__store_owner=user)
+            return Product.objects.filter(store__store_owner=user).prefetch_related('images')
         return Product.objects.none()
 
     def perform_create(self, serializer):
@@ -129,12 +199,30 @@ class ProductCreateAPIView(generics.ListCreateAPIView):
         serializer.save(store=store)
 
 class ProductListAPIView(generics.ListAPIView):
-    queryset =  Product.objects.all()
+    queryset = Product.objects.select_related('store').prefetch_related('images')
     serializer_class = ProductListSerializers
-    filter_backends = [DjangoFilterBackend,SearchFilter]
+    filter_backends = [DjangoFilterBackend,ProductSearchFilter,OrderingFilter]
+    filterset_class = ProductFilter
+    ordering_fields = ['id', 'price', 'effective_price']
+    ordering = '-id'
+    pagination_class = ProductCursorPagination
+
+
+class ProductFacetAPIView(generics.GenericAPIView):
+    queryset = Product.objects.all()
+    filter_backends = [DjangoFilterBackend,ProductSearchFilter]
     filterset_class = ProductFilter
-    search_fields = ['product_name']
 
+    def get(self, request, *args, **kwargs):
+        filter_params = set(ProductFilter.base_filters) | {ProductSearchFilter.search_param}
+        if filter_params & set(request.query_params):
+            return Response(product_facets(self.filter_queryset(self.get_queryset())))
+
+        facets = cache.get(PRODUCT_FACETS_KEY)
+        if facets is None:
+            facets = product_facets(self.get_queryset())
+            cache.set(PRODUCT_FACETS_KEY, facets, PRODUCT_FACETS_TIMEOUT)
+        return Response(facets)
 
 
 class ProductImageAPIView(generics.ListAPIView):
@@ -149,67 +237,149 @@ class ProductImageDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = ProductImage.objects.all()
     serializer_class = ProductImageDetailSerializer
 
-class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
+class ProductDetailAPIView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Product.objects.select_related('store').prefetch_related('images')
     serializer_class = ProductDetailSerializers
     permission_classes = (IsProductOrReadProductOnly,)
 
+    def get_resource_version(self):
+        # в ответе есть имя магазина, поэтому версия зависит и от store.updated_at
+        row = Product.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', 'store__updated_at').first()
+        if row is None:
+            return None
+        return max(row), f'product:{self.kwargs["pk"]}:{row[0].isoformat()}:{row[1].isoformat()}'
+
 class SaleListAPIView(generics.ListCreateAPIView):
     serializer_class = SaleSerializer
 
     def get_queryset(self):
-        now = timezone.now()
-        return Sale.objects.filter(
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now
-        )
+        # is_live держит run_sale_scheduler, тут только индексный поиск по флагу
+        return Sale.objects.filter(is_live=True).select_related('product')
+
+    def list(self, request, *args, **kwargs):
+        key = sales_cache_key(request.build_absolute_uri())
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, SALES_TIMEOUT)
+        return Response(data)
 
 
 class SaleDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Sale.objects.all()
+    queryset = Sale.objects.select_related('product')
     serializer_class = SaleSerializer
 
+def order_queryset():
+    # заказы страницы + все их позиции с товарами: ровно два запроса
+    items = OrderItem.objects.select_related('product').order_by('id')
+    return Order.objects.select_related('customer').prefetch_related(Prefetch('items', queryset=items))
+
+
 class OrderAPIView(generics.ListAPIView):
-    queryset = Order.objects.all()
+    queryset = order_queryset()
     serializer_class = OrderSerializers
 
+
+class MyOrderAPIView(generics.ListAPIView):
+    serializer_class = OrderSerializers
+    permission_classes = (permissions.IsAuthenticated,)
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        return order_queryset().filter(customer=self.request.user)
+
+
 class OrderItemAPIView(generics.ListAPIView):
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.objects.select_related('product')
     serializer_class = OrderItemSerializers
 
 
 
+def review_queryset():
+    # отзывы страницы + все ответы на них: два запроса с автором,
+    # дерево собирает prefetch (reply.parent указывает на уже загруженный отзыв)
+    replies = Review.objects.select_related('user').order_by('created_at')
+    return (
+        Review.objects.select_related('user', 'product')
+        .prefetch_related(Prefetch('replies', queryset=replies))
+    )
+
+
 class ReviewListAPIView(generics.ListCreateAPIView):
-    queryset = Review.objects.all()
     serializer_class = ReviewSerializers
     permission_classes = (permissions.IsAuthenticated,)
+    filterset_fields = ('product',)
+
+    def get_queryset(self):
+        return review_queryset()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 class ReviewDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Review.objects.all()
     serializer_class = ReviewSerializers
     permission_classes = (permissions.IsAuthenticated,)
 
+    def get_queryset(self):
+        return review_queryset()
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
 class CommentListAPIView(generics.ListCreateAPIView):
-    queryset = CommentLike.objects.all()
+    queryset = CommentLike.objects.select_related('user', 'review')
     serializer_class = CommentLikeSerializer
 
 
+class CommentLikeToggleAPIView(generics.GenericAPIView):
+    serializer_class = CommentLikeToggleSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+
+
+def cart_queryset():
+    # корзина с суммой и позиции с товаром и суммой строки — два запроса на любую корзину;
+    # цена — effective_price, та же, что спишет checkout
+    money = DecimalField(max_digits=12, decimal_places=2)
+    items = (
+        CartItem.objects.select_related('product')
+        .annotate(line_total=ExpressionWrapper(F('product__effective_price') * F('quantity'), output_field=money))
+        .order_by('id')
+    )
+    return Cart.objects.annotate(
+        total_amount=Coalesce(
+            Sum(F('items__product__effective_price') * F('items__quantity'), output_field=money),
+            Value(Decimal('0')),
+            output_field=money,
+        )
+    ).prefetch_related(Prefetch('items', queryset=items))
+
+
 class CartAPIView(generics.RetrieveAPIView):
     serializer_class = CartSerializer
 
     def get_object(self):
-        cart, _ = Cart.objects.get_or_create(user=self.request.user)
+        cart, _ = cart_queryset().get_or_create(user=self.request.user)
         return cart
 
-class CartItemCreateAPIView(generics.CreateAPIView):
+class CartBatchAPIView(IdempotencyMixin, generics.GenericAPIView):
+    serializer_class = CartBatchSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = serializer.save()
+        return Response(CartSerializer(cart_queryset().get(pk=cart.pk)).data, status=status.HTTP_200_OK)
+
+class CartItemCreateAPIView(IdempotencyMixin, generics.CreateAPIView):
     serializer_class = CartItemSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -221,14 +391,14 @@ class CartItemCreateAPIView(generics.CreateAPIView):
 
         cart_item, created = CartItem.objects.get_or_create(
             cart=cart,
-            product=product
+            product=product,
+            defaults={'quantity': quantity},
         )
 
         if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        else:
-            serializer.save(cart=cart)
+            CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + quantity)
+            cart_item.refresh_from_db()
+        serializer.instance = cart_item
 
 class CartItemDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CartItemSerializer
@@ -246,6 +416,11 @@ class CartItemDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
             serializer.save()
 
 
+class CheckoutAPIView(IdempotencyMixin, generics.CreateAPIView):
+    serializer_class = CheckoutSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+
 class FavoriteAPIView(generics.RetrieveAPIView):
     serializer_class = FavoriteSerializer
     permission_classes = (permissions.IsAuthenticated,)
@@ -254,7 +429,7 @@ class FavoriteAPIView(generics.RetrieveAPIView):
         favorite, _ = Favorite.objects.get_or_create(user=self.request.user)
         return favorite
 
-class FavoriteProductCreateAPIView(generics.CreateAPIView):
+class FavoriteProductCreateAPIView(IdempotencyMixin, generics.CreateAPIView):
     queryset = FavoriteProduct.objects.all()
 
     serializer_class = FavoriteProductSerializer
@@ -262,18 +437,16 @@ class FavoriteProductCreateAPIView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         favorite, _ = Favorite.objects.get_or_create(user=self.request.user)
-        product = serializer.validated_data['product']
 
-        if FavoriteProduct.objects.filter(
-            favorite=favorite,
-            product=product
-        ).exists():
+        # unique_together ловит и параллельный дубль, в отличие от exists() перед вставкой
+        try:
+            with transaction.atomic():
+                serializer.save(favorite=favorite)
+        except IntegrityError:
             raise serializers.ValidationError(
                 "Этот товар уже в избранном"
             )
 
-        serializer.save(favorite=favorite)
-
 class FavoriteProductDeleteAPIView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = FavoriteProductSerializer
     permission_classes = (permissions.IsAuthenticated,)